@@ -0,0 +1,55 @@
+"""Mehrere Regionen und Modi in einem Aufruf berechnen.
+
+    python batch.py --configs forstamt_a.yaml forstamt_b.yaml --max-parallel 3 --memory-gb 48
+    python batch.py --regions regions.yaml --max-parallel 4 --memory-gb 64
+
+Aufbau einer Regionsliste (regions.yaml):
+
+    base: config.yaml
+    modes: [fruehjahr, sommer]
+    regions:
+      - name: forstamt_a
+        overrides:
+          analyseflaeche: ".../forstamt_a/analyseflaeche.tif"
+        modes:
+          fruehjahr: {force: {ndvi: ".../fruehjahr/NDVI.tif"}}
+          sommer: {force: {ndvi: ".../sommer/NDVI.tif"}}
+
+Jeder Lauf rechnet headless als eigener Prozess. Co-Registrierungen und Trainingsdaten
+liegen in gemeinsamen Caches im Batch-Ordner, ein Sommer-Lauf wartet auf den Frühjahrs-Lauf,
+dessen Ergebnis er liest. Läufe mit gleichen FORCE-Bändern teilen einen Merkmalswürfel, der
+vor dem Start der Läufe gebaut wird. Der Co-Registrierungs-Cache wird erst nach allen Läufen auf
+max_size_gb begrenzt, damit kein Lauf Einträge löscht, die ein anderer gerade verwendet.
+"""
+import argparse
+import os
+import time
+
+from utils.batch import (build_feature_cubes, evict_caches, expand_regions, load_config_runs, prepare_runs,
+                         run_batch, write_report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline for many regions and modes")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--configs", nargs="+", help="Paths to config.yaml files, one run each")
+    group.add_argument("--regions", type=str, help="Path to a region list (base config x regions x modes)")
+    parser.add_argument("--batch-folder", type=str, default="batch_output",
+                        help="Folder for shared caches, generated configs, logs and the report")
+    parser.add_argument("--max-parallel", type=int, default=2, help="Maximum number of concurrent runs")
+    parser.add_argument("--memory-gb", type=float, default=None, help="Memory budget for all concurrent runs")
+    args = parser.parse_args()
+
+    runs = load_config_runs(args.configs) if args.configs else expand_regions(args.regions)
+    os.makedirs(args.batch_folder, exist_ok=True)
+    prepare_runs(runs, args.batch_folder, args.max_parallel)
+
+    start = time.time()
+    build_feature_cubes(runs)
+    run_batch(runs, args.batch_folder, args.max_parallel, args.memory_gb)
+    evict_caches(runs)
+    write_report(runs, args.batch_folder, time.time() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Benchmarks aller Pipeline-Stufen auf synthetischen Daten.
+
+Jede Stufe läuft in einem eigenen Prozess, damit der Spitzen-Speicherbedarf (max RSS)
+pro Stufe gemessen wird: getrennt für den Stufenprozess und den größten Worker sowie unter
+Linux als gemessene Summe aller gleichzeitig laufenden Prozesse der Stufe. cpu_s enthält
+die CPU-Zeit der Worker. Die Ergebnisse werden als JSON gespeichert und können mit
+--compare gegen einen früheren Lauf (z.B. eines anderen Commits) verglichen werden.
+
+    python -m benchmarks.run_benchmarks --scales small medium --output bench.json
+    python -m benchmarks.run_benchmarks --scales small --compare bench_alt.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SCALES, generate
+from utils.profiling import _maxrss_mb, _rss_mb, _sample_rss, _workers, _workers_rss_mb
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _stage_run_maxent(paths, out, windowed=False):
+    from modules.maxent_classification import run_maxent
+    run_maxent(paths["ndvi"], paths["ndwi"], paths["nbr"], paths["dswi"], paths["swir1"],
+               paths["training_points"], "class_cor", os.path.join(out, "classification.tif"),
+               windowed=windowed)
+
+
+def _stage_filter_classification(paths, out, block_size=None):
+    from modules.data_processing import filter_classification
+    filter_classification(paths["ndvi"], paths["classification"], paths["analyseflaeche"], 0.1,
+                          os.path.join(out, "classification_filtered.tif"), block_size=block_size)
+
+
+def _stage_calculate_disturbance(paths, out, block_size=None):
+    from modules.postprocess import calculate_disturbance
+    calculate_disturbance(paths["harmonic"], paths["analyseflaeche"], paths["classification"], "sommer",
+                          os.path.join(out, "disturbance.tif"), block_size=block_size)
+
+
+def _stage_calculate_disturbance_change(paths, out, block_size=None):
+    from modules.postprocess import calculate_disturbance_change
+    calculate_disturbance_change(paths["summer"], paths["spring"], paths["classification"], "sommer",
+                                 os.path.join(out, "change.tif"), block_size=block_size)
+
+
+def _stage_vectorize_raster(paths, out, sieve=False):
+    from modules.data_processing import vectorize_raster
+    vectorize_raster(paths["change"], 500, os.path.join(out, "change_vectorized.gpkg"), sieve=sieve)
+
+
+# Name -> (Funktion, Parameter)
+STAGES = {
+    "run_maxent": (_stage_run_maxent, {}),
+    "run_maxent_windowed": (_stage_run_maxent, {"windowed": True}),
+    "filter_classification": (_stage_filter_classification, {}),
+    "filter_classification_blocks": (_stage_filter_classification, {"block_size": 1024}),
+    "calculate_disturbance": (_stage_calculate_disturbance, {}),
+    "calculate_disturbance_blocks": (_stage_calculate_disturbance, {"block_size": 1024}),
+    "calculate_disturbance_change": (_stage_calculate_disturbance_change, {}),
+    "calculate_disturbance_change_blocks": (_stage_calculate_disturbance_change, {"block_size": 1024}),
+    "vectorize_raster": (_stage_vectorize_raster, {}),
+    "vectorize_raster_sieve": (_stage_vectorize_raster, {"sieve": True}),
+}
+
+
+def _peak_rss_mb():
+    """Spitzen-Speicherbedarf des Stufenprozesses und des größten beendeten Workers in MB."""
+    if resource is None:
+        return None, None
+    return _maxrss_mb(resource.RUSAGE_SELF), _maxrss_mb(resource.RUSAGE_CHILDREN)
+
+
+def _tree_rss_mb():
+    """Aktueller Speicherbedarf (RSS) des Stufenprozesses und aller Worker in MB (nur Linux)."""
+    return _rss_mb() + _workers_rss_mb()
+
+
+def _run_stage(name, paths, out, queue):
+    func, kwargs = STAGES[name]
+    # Summe über Stufenprozess und Worker, die gleichzeitig laufen (ru_maxrss kennt nur Einzelprozesse)
+    peak_total = [0.0]
+    stop = threading.Event()
+    sampler = None
+    if _workers() is not None:
+        sampler = threading.Thread(target=_sample_rss, args=(stop, peak_total, _tree_rss_mb, 0.05), daemon=True)
+        sampler.start()
+
+    wall = time.perf_counter()
+    times_start = os.times()
+    func(paths, out, **kwargs)
+    times_end = os.times()
+    wall = time.perf_counter() - wall
+
+    if sampler is not None:
+        stop.set()
+        sampler.join()
+    cpu_parent = times_end.user + times_end.system - times_start.user - times_start.system
+    cpu_workers = (times_end.children_user + times_end.children_system
+                   - times_start.children_user - times_start.children_system)
+    peak_parent, peak_worker = _peak_rss_mb()
+    queue.put({
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu_parent + cpu_workers, 3),
+        "cpu_parent_s": round(cpu_parent, 3),
+        "cpu_workers_s": round(cpu_workers, 3),
+        "peak_rss_mb": peak_parent,
+        "peak_rss_worker_mb": peak_worker,
+        # kurze Spitzen zwischen zwei Messungen fehlen, mindestens aber der größte Einzelprozess
+        "peak_rss_total_mb": round(max(peak_total[0], peak_parent, peak_worker), 1) if sampler is not None else None,
+    })
+
+
+def run_stage(name, paths, out):
+    """Führt eine Stufe in einem frischen Prozess aus und gibt die Messwerte zurück."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_stage, args=(name, paths, out, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return {"error": f"exit code {process.exitcode}"}
+    return queue.get()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, reference_path):
+    """Gibt das Verhältnis der Laufzeit und des Speichers zu einem früheren Lauf aus."""
+    with open(reference_path) as f:
+        reference = {(r["scale"], r["stage"]): r for r in json.load(f)["results"]}
+
+    print(f"\n{'Skalierung':<10} {'Stufe':<38} {'Zeit alt':>9} {'Zeit neu':>9} {'Faktor':>7} {'RSS Faktor':>10}")
+    for r in results:
+        old = reference.get((r["scale"], r["stage"]))
+        if old is None or "wall_s" not in old or "wall_s" not in r:
+            continue
+        speed = old["wall_s"] / r["wall_s"] if r["wall_s"] else float("inf")
+        # Gesamtspeicher aller Prozesse der Stufe, bei älteren Berichten nur der Stufenprozess
+        key = "peak_rss_total_mb" if r.get("peak_rss_total_mb") and old.get("peak_rss_total_mb") else "peak_rss_mb"
+        rss = (r[key] / old[key]) if r.get(key) and old.get(key) else None
+        rss_text = f"{rss:.2f}" if rss is not None else "-"
+        print(f"{r['scale']:<10} {r['stage']:<38} {old['wall_s']:>9.2f} {r['wall_s']:>9.2f} {speed:>6.2f}x {rss_text:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks der Pipeline-Stufen auf synthetischen Daten")
+    parser.add_argument("--scales", nargs="+", default=["small"], choices=list(SCALES))
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--workdir", default=os.path.join("benchmarks", "data"),
+                        help="Ordner für synthetische Daten und Ergebnisse der Stufen")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_output.json", help="JSON-Datei für die Ergebnisse")
+    parser.add_argument("--compare", help="JSON-Datei eines früheren Laufs zum Vergleich")
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        folder = os.path.join(args.workdir, scale)
+        print(f"Erzeuge synthetische Daten ({scale}, {SCALES[scale]} x {SCALES[scale]} Pixel)..")
+        paths = generate(os.path.join(folder, "input"), scale, args.seed)
+        out = os.path.join(folder, "output")
+        os.makedirs(out, exist_ok=True)
+
+        for stage in args.stages:
+            print(f"Benchmark {stage} ({scale})..")
+            measurement = run_stage(stage, paths, out)
+            measurement.update({"scale": scale, "pixels": SCALES[scale] ** 2, "stage": stage})
+            results.append(measurement)
+            print(f"  {measurement}")
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Ergebnisse gespeichert unter: {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Startzeit von main.py und Wächter für den schnellen Pfad leichter Stufen.
+
+Misst in frischen Prozessen die Zeit für main.py --help und für Läufe der Unterbefehle
+change und statistics (Rasterzonen) auf synthetischen Daten. Danach wird geprüft, dass
+dabei keine schweren Abhängigkeiten (sklearn, geopandas, shapely, ...) importiert wurden. Der Exit-Code ist 1,
+wenn ein verbotenes Modul geladen wurde oder die Startzeit über --max-startup-s liegt.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10 --max-startup-s 1.0 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+
+# Module, die die Unterbefehle change und statistics (Rasterzonen) nicht laden dürfen
+HEAVY_MODULES = ["sklearn", "joblib", "geopandas", "pandas", "shapely", "fiona", "tqdm", "pyinstrument"]
+
+# Führt main.py im Kindprozess aus und meldet danach Laufzeit und geladene Module
+_RUNNER = """
+import json, runpy, sys, time
+start = time.perf_counter()
+sys.argv = [{main!r}] + {argv!r}
+try:
+    runpy.run_path({main!r}, run_name="__main__")
+finally:
+    print("STARTUP_RESULT " + json.dumps({{"wall_s": time.perf_counter() - start,
+                                         "modules": sorted({{name.split(".")[0] for name in sys.modules}})}}))
+"""
+
+
+def _run(argv):
+    """Startet main.py mit argv in einem frischen Interpreter, gibt Laufzeit und Top-Level-Module zurück."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", _RUNNER.format(main=MAIN, argv=argv)],
+                            capture_output=True, text=True, cwd=ROOT)
+    wall = time.perf_counter() - start
+    lines = [line for line in result.stdout.splitlines() if line.startswith("STARTUP_RESULT ")]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"main.py {' '.join(argv)} fehlgeschlagen:\n{result.stdout}\n{result.stderr}")
+    measurement = json.loads(lines[-1][len("STARTUP_RESULT "):])
+    measurement["process_s"] = wall
+    return measurement
+
+
+def _change_config(paths, folder):
+    """Konfiguration für Differenz und Flächenstatistik auf den synthetischen Daten.
+
+    Zonen der Statistik ist die Analysefläche (Raster).
+    """
+    with open(os.path.join(ROOT, "config.yaml")) as f:
+        config = yaml.safe_load(f)
+    output_folder = os.path.join(folder, "output")
+    os.makedirs(output_folder, exist_ok=True)
+    # Schadflächenergebnis des Laufs, das die Differenz liest
+    year = str(datetime.now().year)
+    shutil.copyfile(paths["summer"], os.path.join(output_folder, f"disturbance_monitoring_{year}_sommer.tif"))
+    config.update({
+        "output_folder": output_folder,
+        "modus": "sommer",
+        "result_last_year_summer": paths["summer"],
+        "result_current_year_spring": paths["spring"],
+        "incremental": False,
+        "headless": True,
+        "profile": None,
+        "statistics": {"enabled": False, "zones": paths["analyseflaeche"], "format": "csv"},
+    })
+    config_path = os.path.join(folder, "config_startup.yaml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    return config_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startzeit von main.py und Importe des schnellen Pfads")
+    parser.add_argument("--repeat", type=int, default=5, help="Wiederholungen je Messung (Median)")
+    parser.add_argument("--workdir", default=os.path.join("benchmarks", "data"),
+                        help="Ordner für synthetische Daten und Ergebnisse")
+    parser.add_argument("--max-startup-s", type=float, default=None,
+                        help="Obergrenze für den Median von main.py --help in Sekunden")
+    parser.add_argument("--output", default=None, help="JSON-Datei für die Ergebnisse")
+    args = parser.parse_args()
+
+    folder = os.path.join(args.workdir, "small")
+    paths = generate(os.path.join(folder, "input"), "small")
+    config_path = _change_config(paths, os.path.join(folder, "startup"))
+
+    results = {}
+    failures = []
+    for name, argv in (("help", ["--help"]), ("change", ["change", "--config", config_path]),
+                       ("statistics", ["statistics", "--config", config_path])):
+        runs = [_run(argv) for _ in range(args.repeat)]
+        heavy = sorted({module for run in runs for module in run["modules"] if module in HEAVY_MODULES})
+        results[name] = {
+            "median_s": round(statistics.median(run["wall_s"] for run in runs), 3),
+            "median_process_s": round(statistics.median(run["process_s"] for run in runs), 3),
+            "heavy_modules": heavy,
+        }
+        print(f"{name:<10} main.py {results[name]['median_s']:.3f} s, "
+              f"Prozess {results[name]['median_process_s']:.3f} s, schwere Module: {', '.join(heavy) or '-'}")
+        if heavy:
+            failures.append(f"{name} lädt {', '.join(heavy)}")
+
+    if args.max_startup_s is not None and results["help"]["median_process_s"] > args.max_startup_s:
+        failures.append(f"main.py --help dauert {results['help']['median_process_s']} s "
+                        f"(Grenze {args.max_startup_s} s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "results": results,
+                "failures": failures,
+            }, f, indent=2)
+        print(f"Ergebnisse gespeichert unter: {args.output}")
+
+    for failure in failures:
+        print(f"FEHLER: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Synthetische, reproduzierbare Eingangsdaten für die Benchmarks.
+
+Alle Raster liegen auf demselben 10 m Gitter (EPSG:25832) und entstehen aus einem festen
+Seed, sodass Läufe auf verschiedenen Commits dieselben Daten verarbeiten.
+"""
+import os
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import Point
+
+# Kantenlänge der quadratischen Raster in Pixeln je Skalierung
+SCALES = {
+    "small": 512,
+    "medium": 2048,
+    "large": 8192,
+}
+
+BAND_NAMES = ["ndvi", "ndwi", "nbr", "dswi", "swir1"]
+N_TRAINING_POINTS = 2000
+PIXEL_SIZE = 10
+CRS = "EPSG:25832"
+
+
+def _profile(size, dtype, nodata):
+    return {
+        "driver": "GTiff",
+        "height": size,
+        "width": size,
+        "count": 1,
+        "dtype": dtype,
+        "nodata": nodata,
+        "crs": CRS,
+        "transform": from_origin(600000, 5600000, PIXEL_SIZE, PIXEL_SIZE),
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256,
+    }
+
+
+def _patches(rng, size, patch, low, high):
+    """Flächiges Klassenmuster aus Quadraten der Kantenlänge patch."""
+    n = size // patch + 1
+    return rng.integers(low, high, (n, n)).repeat(patch, 0).repeat(patch, 1)[:size, :size]
+
+
+def _write(path, array, dtype, nodata):
+    with rasterio.open(path, "w", **_profile(array.shape[0], dtype, nodata)) as dst:
+        dst.write(array.astype(dtype), 1)
+    return path
+
+
+def generate(folder, scale="small", seed=42):
+    """Erzeugt alle Eingaben einer Skalierung in folder und gibt ein dict der Pfade zurück.
+
+    Vorhandene Daten werden wiederverwendet, wenn die Marker-Datei zu Skalierung und Seed passt.
+    """
+    size = SCALES[scale]
+    os.makedirs(folder, exist_ok=True)
+    paths = {name: os.path.join(folder, f"{name}.tif") for name in BAND_NAMES}
+    paths.update({
+        "analyseflaeche": os.path.join(folder, "analyseflaeche.tif"),
+        "harmonic": os.path.join(folder, "harmonic.tif"),
+        "summer": os.path.join(folder, "summer.tif"),
+        "spring": os.path.join(folder, "spring.tif"),
+        "classification": os.path.join(folder, "classification.tif"),
+        "change": os.path.join(folder, "change.tif"),
+        "training_points": os.path.join(folder, "training_points.shp"),
+    })
+
+    marker = os.path.join(folder, "generated.txt")
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read() == f"{scale}:{seed}":
+                return paths
+
+    rng = np.random.default_rng(seed)
+
+    # Klassen 1-4 (Nadelwald, Freifläche, stehend abgestorben, sonstiger Wald) als Grundmuster
+    classes = _patches(rng, size, 24, 1, 5)
+
+    # Bänder: klassenabhängiges Signal mit Rauschen, erste Zeilen NoData
+    for i, name in enumerate(BAND_NAMES):
+        band = classes * (i + 1) * 0.1 + rng.normal(0, 0.15, (size, size))
+        band[:4, :] = -9999
+        _write(paths[name], band, "float32", -9999)
+
+    # Analysefläche (0 = außerhalb, 1 = Nadelwald, 2 = sonstiger Wald, 3 = Lärche), ca. 40 % außerhalb
+    ana = _patches(rng, size, 64, 1, 4)
+    ana[_patches(rng, size, 64, 0, 10) < 4] = 0
+    _write(paths["analyseflaeche"], ana, "uint8", 0)
+
+    _write(paths["harmonic"], rng.normal(-40, 30, (size, size)), "float32", None)
+    _write(paths["summer"], _patches(rng, size, 8, 0, 5), "uint8", 0)
+    _write(paths["spring"], _patches(rng, size, 8, 0, 5), "uint8", 0)
+    _write(paths["classification"], classes, "uint8", 0)
+
+    # Stark fragmentiertes Differenzraster für Vektorisierung und Polygon-Merge
+    change = _patches(rng, size, 6, 0, 5)
+    noise = rng.random((size, size)) < 0.05
+    change[noise] = rng.integers(0, 5, noise.sum())
+    _write(paths["change"], change, "uint8", 0)
+
+    # Trainingspunkte in Pixelmitten mit der Klasse des Grundmusters
+    rows = rng.integers(4, size, N_TRAINING_POINTS)
+    cols = rng.integers(0, size, N_TRAINING_POINTS)
+    xs = 600000 + (cols + 0.5) * PIXEL_SIZE
+    ys = 5600000 - (rows + 0.5) * PIXEL_SIZE
+    gpd.GeoDataFrame({"class_cor": classes[rows, cols]},
+                     geometry=[Point(x, y) for x, y in zip(xs, ys)], crs=CRS).to_file(paths["training_points"])
+
+    with open(marker, "w") as f:
+        f.write(f"{scale}:{seed}")
+    return paths
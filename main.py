@@ -1,14 +1,42 @@
-from utils.parser import load_config
-from utils.helper import *
-from modules.postprocess import *
-from modules.maxent_classification import *
-from modules.data_processing import *
-from geo_utils.raster_utils import *
+"""Schadflächen-Monitoring: alle Stufen oder eine einzelne Stufe per Unterbefehl.
+
+    python main.py --config config.yaml               # alle Stufen (wie run-all)
+    python main.py change --config config.yaml        # nur die Differenz
+
+Schwere Abhängigkeiten (sklearn, geopandas, shapely) werden erst in der Stufe importiert,
+die sie benötigt. So starten leichte Stufen und per spawn gestartete Worker-Prozesse schnell.
+"""
 import os
 from datetime import datetime
+from utils.parser import load_config
 
-def main():
-    config = load_config()
+# Unterbefehl -> Stufen des Stufengraphs (Merkmalswürfel wird bei Bedarf mit aktualisiert)
+COMMAND_STAGES = {
+    "classify": ("feature_cube", "classification"),
+    "filter": ("feature_cube", "filter_classification"),
+    "disturbance": ("calculate_disturbance",),
+    "change": ("calculate_disturbance_change",),
+    "vectorize": ("vectorize",),
+    "statistics": ("statistics",),
+}
+
+def check_inputs(stages):
+    """Prüft vor einzelnen Stufen, dass alle Eingaben vorhanden sind oder von einer der Stufen erzeugt werden."""
+    produced = {path for s in stages for path in s["outputs"] if path}
+    for s in stages:
+        missing = [path for path in s["inputs"] if path and path not in produced and not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"Stufe {s['name']}: Eingaben fehlen, zuerst die vorherigen Stufen berechnen: "
+                                    f"{', '.join(missing)}")
+
+def run_pipeline(config, run, only=None):
+    """Baut den Stufengraph und führt ihn aus. only: Namen der Stufen eines Unterbefehls, None = alle."""
+    from modules.rules import DISTURBANCE_CLASSES, CHANGE_CLASSES
+    from utils.output import configure_output
+    from utils.stages import run_stages
+
+    # Einstellungen für alle Ausgaberaster (Kompression, Kacheln, Übersichten)
+    configure_output(config.get("output"))
 
     # Output folder definieren
     output_folder_path = config["output_folder"]
@@ -24,53 +52,253 @@ def main():
     classification_path = os.path.join(temp_folder_path, "classification.tif")
     ndvi_threshold = config["ndvi_threshold"]
     classification_filtered_path = os.path.join(temp_folder_path, f"classification_filtered_{ndvi_threshold}.tif")
-    classification_coreg_path = os.path.join(temp_folder_path, "classification_coreg.tif")
-    harmonic_coreg_path = os.path.join(temp_folder_path, "harmonic_coreg.tif")
-    analyseflaeche_coreg_path = os.path.join(temp_folder_path, "analyseflaeche_coreg.tif")
+    coreg_cache = config.get("coreg_cache") or {}
+    coreg_cache_dir = coreg_cache.get("folder") or os.path.join(temp_folder_path, "coreg_cache")
+    coreg_cache_size = coreg_cache.get("max_size_gb", 20)
+    sample_cache_dir = config.get("sample_cache") or os.path.join(temp_folder_path, "sample_cache")
+    model_path = config["maxent"].get("model") or os.path.join(temp_folder_path, "maxent_model.joblib")
+    block_size = config.get("block_size")
     disturbence_path = os.path.join(output_folder_path, f"disturbance_monitoring_{year}_{modus}.tif")
     difference_path = os.path.join(output_folder_path, f"disturbance_change_{year}_{modus}.tif")
 
-    # MaxEnt Klassifikation
-    if config["maxent"]["classification"] is None:
-        run_maxent(config["force"]["ndvi"], config["force"]["ndwi"], config["force"]["nbr"], config["force"]["dswi"],
-                   config["force"]["swir1"], config["maxent"]["training_points"], config["maxent"]["class_attribute"],
-                   classification_path)
-        if config["calc_disturbence"]:
-            co_registration(result_last_year, classification_path, "nearest",
-                                                   classification_coreg_path)
-        hold_point(config, "Klassifikation berechnet. Ergebnisse prüfen. Weiter mit Enter, Abbruch mit 'n'")
-
-    if config["postprocess_classification"]:
+    n_workers = config.get("n_workers")
+    windowed = config["maxent"].get("windowed", False)
+    # Klassifikation und Filterung nur innerhalb der Analysefläche
+    aoi_only = config.get("aoi_only", False)
+    aoi_path = config["analyseflaeche"] if aoi_only else None
+    # Einzelne Stufen laufen immer getrennt, auch wenn fused gesetzt ist
+    fused = config.get("fused", False) and only is None
+
+    def force_paths():
+        # FORCE-Bänder in der Reihenfolge des Merkmalsvektors, Import nur für Stufen, die sie lesen
+        from modules.feature_cube import BAND_NAMES
+        return [config["force"][name] for name in BAND_NAMES]
+
+    # Vorhandene Klassifikation oder Ergebnis der Klassifikationsstufe
+    classification = config["maxent"]["classification"] or classification_path
+    vector_path = os.path.splitext(difference_path)[0] + \
+        ("_vectorized.gpkg" if config.get("vectorize_tile_size") else "_vectorized.shp")
+
+    # Flächenstatistik je Zone (Standard: Analysefläche) und Klasse
+    statistics = config.get("statistics") or {}
+    stats_zones = statistics.get("zones") or config["analyseflaeche"]
+    stats_format = statistics.get("format", "csv")
+    stats_products = []
+    if config["calc_disturbence"] or config.get("fused", False) or (only and os.path.exists(disturbence_path)):
+        stats_products.append((disturbence_path, DISTURBANCE_CLASSES))
+    if config["calc_difference"] or (only and os.path.exists(difference_path)):
+        stats_products.append((difference_path, CHANGE_CLASSES))
+
+    def stats_path(path):
+        return f"{os.path.splitext(path)[0]}_stats.{stats_format}"
+
+    # Merkmalswürfel einmalig aufbauen (nur neu, wenn sich die FORCE-Bänder geändert haben)
+    feature_cube = config.get("feature_cube")
+    cube_meta = os.path.join(feature_cube, "meta.json") if feature_cube else None
+
+    def feature_cube_stage():
+        from modules.feature_cube import BAND_NAMES, build_feature_cube
+        build_feature_cube({name: config["force"][name] for name in BAND_NAMES}, feature_cube)
+
+    def fused_stage():
+        from modules.pipeline import run_fused_pipeline
+        run_fused_pipeline(result_last_year, config["force"], config["harmonic_result"], config["analyseflaeche"],
+                           modus, disturbence_path,
+                           classification_path=config["maxent"]["classification"],
+                           training_points=config["maxent"]["training_points"],
+                           class_attribute=config["maxent"]["class_attribute"],
+                           ndvi_threshold=ndvi_threshold if config["postprocess_classification"] else None,
+                           spring_path=config["result_current_year_spring"],
+                           difference_path=difference_path if config["calc_difference"] else None,
+                           intermediate_folder=temp_folder_path if config.get("keep_intermediates", False) else None,
+                           block_size=block_size, n_workers=n_workers, cache_dir=sample_cache_dir,
+                           model_path=config["maxent"].get("model"))
+
+    def classification_stage():
+        from modules.maxent_classification import load_current_model, predict_maxent, run_maxent
+        if config["maxent"].get("model") and load_current_model(model_path, config["maxent"]["training_points"],
+                                                                config["maxent"]["class_attribute"]) is not None:
+            # Nur Vorhersage mit gespeichertem, zu den Trainingspunkten passendem Modell
+            predict_maxent(model_path, config["force"]["ndvi"], config["force"]["ndwi"], config["force"]["nbr"],
+                           config["force"]["dswi"], config["force"]["swir1"], classification_path,
+                           windowed=windowed, n_workers=n_workers, feature_cube=feature_cube, aoi_path=aoi_path)
+        else:
+            run_maxent(config["force"]["ndvi"], config["force"]["ndwi"], config["force"]["nbr"], config["force"]["dswi"],
+                       config["force"]["swir1"], config["maxent"]["training_points"], config["maxent"]["class_attribute"],
+                       classification_path, windowed=windowed, n_workers=n_workers, cache_dir=sample_cache_dir,
+                       model_path=model_path, feature_cube=feature_cube, aoi_path=aoi_path)
+
+    def filter_stage():
+        from modules.data_processing import filter_classification
+        from utils.coregistration import cached_co_registration
+        from utils.profiling import stage
         # Co-registration der Analysefläche
-        analyseflaeche = co_registration(config["maxent"]["classification"], config["analyseflaeche"], "nearest")
+        with stage(run, "co_registration_filter", inputs=[config["analyseflaeche"]]) as record:
+            analyseflaeche = cached_co_registration(classification, config["analyseflaeche"], "nearest",
+                                                    coreg_cache_dir, coreg_cache_size)
+            record["outputs"].append(analyseflaeche)
 
         # Filtern der Klassifikation mit NDVI Schwellenwert
-        filter_classification(config["force"]["ndvi"], config["maxent"]["classification"], analyseflaeche, ndvi_threshold, classification_filtered_path)
+        filter_classification(config["force"]["ndvi"], classification, analyseflaeche, ndvi_threshold, classification_filtered_path,
+                              block_size=block_size, feature_cube=feature_cube, aoi_only=aoi_only)
 
-        hold_point(config, "Klassifikation gefiltert. Ergebnisse prüfen. Wenn das Ergebnis für die Schadflächenberechnung genutzt werden soll "
-                           "bitte Abbruch mit 'n' und anschließend den Pfad zur Klassifikation in den Parametern aktualisieren.")
-
-    if config["calc_disturbence"]:
+    def disturbance_stage():
+        from modules.postprocess import calculate_disturbance
+        from utils.coregistration import cached_co_registration
+        from utils.profiling import stage
         # Co-registration der benötigten Raster mit dem Ergebnis des vergangenen Jahres
-        co_registration(result_last_year, config["harmonic_result"], "nearest", harmonic_coreg_path)
-        co_registration(result_last_year, config["analyseflaeche"], "nearest", analyseflaeche_coreg_path)
-        co_registration(result_last_year, config["maxent"]["classification"], "nearest", classification_coreg_path)
+        # (aus dem Cache, falls sich Quelle und Zielgitter nicht geändert haben)
+        with stage(run, "co_registration_disturbance",
+                   inputs=[config["harmonic_result"], config["analyseflaeche"], classification]) as record:
+            harmonic_coreg_path = cached_co_registration(result_last_year, config["harmonic_result"], "nearest",
+                                                         coreg_cache_dir, coreg_cache_size)
+            analyseflaeche_coreg_path = cached_co_registration(result_last_year, config["analyseflaeche"], "nearest",
+                                                               coreg_cache_dir, coreg_cache_size)
+            classification_coreg_path = cached_co_registration(result_last_year, classification, "nearest",
+                                                               coreg_cache_dir, coreg_cache_size)
+            record["outputs"].extend([harmonic_coreg_path, analyseflaeche_coreg_path, classification_coreg_path])
 
         # Berechnung Schadflächen
-        calculate_disturbance(harmonic_coreg_path, analyseflaeche_coreg_path, classification_coreg_path, config["modus"], disturbence_path)
+        calculate_disturbance(harmonic_coreg_path, analyseflaeche_coreg_path, classification_coreg_path, config["modus"], disturbence_path,
+                              block_size=block_size)
 
-        hold_point(config, "Schadflächen berechnet. Ergebnisse prüfen. Weiter mit Enter, Abbruch mit 'n'")
+    def change_stage():
+        from modules.postprocess import calculate_disturbance_change
+        calculate_disturbance_change(config["result_last_year_summer"], config["result_current_year_spring"], disturbence_path, config["modus"], difference_path,
+                                     block_size=block_size)
 
-    # Berechnung der Differenz
-    if config["calc_difference"]:
-        calculate_disturbance_change(config["result_last_year_summer"], config["result_current_year_spring"], disturbence_path, config["modus"], difference_path)
+    def vectorize_stage():
+        from modules.data_processing import vectorize_raster, vectorize_raster_tiled
+        # Vektorisieren und filtern des disturbence change Rasters
+        if config.get("vectorize_tile_size"):
+            vectorize_raster_tiled(difference_path, config["min_area"], vector_path,
+                                   tile_size=config["vectorize_tile_size"], n_workers=n_workers,
+                                   sieve=config.get("sieve", False))
+        else:
+            vectorize_raster(difference_path, config["min_area"], vector_path, sieve=config.get("sieve", False))
+
+    def statistics_stage():
+        from modules.statistics import area_statistics
+        for path, class_names in stats_products:
+            area_statistics(path, stats_zones, statistics.get("zone_field"), stats_path(path),
+                            class_names=class_names, block_size=block_size)
+
+    # Stufengraph: jede Stufe mit Eingaben, ergebnisrelevanten Parametern und Ausgaben.
+    # Die Reihenfolge ist topologisch, Abhängigkeiten ergeben sich über die Pfade.
+    stages = []
+    if feature_cube and not fused and \
+            (config["maxent"]["classification"] is None or config["postprocess_classification"] or only):
+        stages.append({"name": "feature_cube", "run": feature_cube_stage, "inputs": force_paths(),
+                       "outputs": [cube_meta]})
 
-        hold_point(config, "Differenz berechnet. Ergebnisse prüfen. Weiter mit Enter, Abbruch mit 'n'")
+    # Verknüpfte Berechnung ohne Zwischendateien
+    if fused:
+        fused_outputs = [disturbence_path, difference_path if config["calc_difference"] else None]
+        if config.get("keep_intermediates", False):
+            fused_outputs.append(os.path.join(temp_folder_path, "classification_coreg.tif"))
+            if config["postprocess_classification"]:
+                fused_outputs.append(classification_filtered_path)
+        classify = config["maxent"]["classification"] is None
+        stages.append({
+            "name": "fused_pipeline",
+            "run": fused_stage,
+            "inputs": [result_last_year, config["harmonic_result"], config["analyseflaeche"],
+                       config["maxent"]["classification"], config["force"]["ndvi"],
+                       config["result_current_year_spring"] if config["calc_difference"] else None]
+                      + (force_paths() + [config["maxent"]["training_points"]] if classify else []),
+            "params": {"modus": modus, "class_attribute": config["maxent"]["class_attribute"],
+                       "ndvi_threshold": ndvi_threshold if config["postprocess_classification"] else None},
+            # Das Modell ist Zwischenspeicher der Stufe, unabhängig davon, ob es schon existiert
+            "outputs": fused_outputs + ([config["maxent"].get("model")] if classify else []),
+            "hold": "Schadflächen und Differenz berechnet. Ergebnisse prüfen. Weiter mit Enter, Abbruch mit 'n'",
+        })
+
+    # MaxEnt Klassifikation
+    elif config["maxent"]["classification"] is None or (only and "classification" in only):
+        stages.append({
+            "name": "classification",
+            "run": classification_stage,
+            # Ein gespeichertes Modell wird gelesen, wenn es zu den Trainingspunkten passt, sonst
+            # wird trainiert. Es ist daher Ausgabe (Zwischenspeicher) und nicht Eingabe der Stufe.
+            "inputs": force_paths() + [cube_meta, aoi_path, config["maxent"]["training_points"]],
+            "params": {"class_attribute": config["maxent"]["class_attribute"], "aoi_only": aoi_only},
+            "outputs": [classification_path, model_path],
+            "hold": "Klassifikation berechnet. Ergebnisse prüfen. Weiter mit Enter, Abbruch mit 'n'",
+        })
+
+    if (config["postprocess_classification"] or (only and "filter_classification" in only)) and not fused:
+        stages.append({
+            "name": "filter_classification",
+            "run": filter_stage,
+            "inputs": [config["force"]["ndvi"], classification, config["analyseflaeche"], cube_meta],
+            "params": {"ndvi_threshold": ndvi_threshold, "aoi_only": aoi_only},
+            "outputs": [classification_filtered_path],
+            "hold": "Klassifikation gefiltert. Ergebnisse prüfen. Wenn das Ergebnis für die Schadflächenberechnung genutzt werden soll "
+                    "bitte Abbruch mit 'n' und anschließend den Pfad zur Klassifikation in den Parametern aktualisieren.",
+        })
+
+    if (config["calc_disturbence"] or (only and "calculate_disturbance" in only)) and not fused:
+        stages.append({
+            "name": "calculate_disturbance",
+            "run": disturbance_stage,
+            "inputs": [result_last_year, config["harmonic_result"], config["analyseflaeche"], classification],
+            "params": {"modus": modus},
+            "outputs": [disturbence_path],
+            "hold": "Schadflächen berechnet. Ergebnisse prüfen. Weiter mit Enter, Abbruch mit 'n'",
+        })
+
+    # Berechnung der Differenz
+    if (config["calc_difference"] or (only and "calculate_disturbance_change" in only)) and not fused:
+        stages.append({
+            "name": "calculate_disturbance_change",
+            "run": change_stage,
+            "inputs": [config["result_last_year_summer"], config["result_current_year_spring"], disturbence_path],
+            "params": {"modus": modus},
+            "outputs": [difference_path],
+            "hold": "Differenz berechnet. Ergebnisse prüfen. Weiter mit Enter, Abbruch mit 'n'",
+        })
 
     # Vektorisieren der Differenzberechnung
-    if config["vectorize"]:
-        # Vektorisieren und filtern des disturbence change Rasters
-        vectorize_raster(difference_path, config["min_area"])
+    if config["vectorize"] or (only and "vectorize" in only):
+        stages.append({
+            "name": "vectorize",
+            "run": vectorize_stage,
+            "inputs": [difference_path],
+            "params": {"min_area": config["min_area"], "sieve": config.get("sieve", False),
+                       "tile_size": config.get("vectorize_tile_size")},
+            "outputs": [vector_path],
+        })
+
+    # Flächen je Zone und Klasse ohne Vektorisierung
+    if (statistics.get("enabled", False) or (only and "statistics" in only)) and stats_products:
+        stages.append({
+            "name": "statistics",
+            "run": statistics_stage,
+            "inputs": [path for path, _ in stats_products] + [stats_zones],
+            "params": {"zone_field": statistics.get("zone_field"), "format": stats_format},
+            "outputs": [stats_path(path) for path, _ in stats_products],
+        })
+
+    if only is not None:
+        stages = [s for s in stages if s["name"] in only]
+        if not stages:
+            print(f"Keine Stufe für {', '.join(only)} in dieser Konfiguration.")
+        check_inputs(stages)
+
+    # Aktuelle Stufen überspringen, geänderte und nachfolgende Stufen neu berechnen
+    run_stages(stages, os.path.join(temp_folder_path, "stages"), run, config,
+               incremental=config.get("incremental", False))
+
+def main():
+    config = load_config()
+    from utils.profiling import start_run, write_manifest
+
+    # Laufzeit, Speicher und I/O je Stufe erfassen, Protokoll auch bei Abbruch schreiben
+    run = start_run(config, config["output_folder"], config.get("profile"))
+    try:
+        run_pipeline(config, run, COMMAND_STAGES.get(config["command"]))
+    finally:
+        write_manifest(run)
 
 if __name__ == "__main__":
     main()
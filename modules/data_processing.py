@@ -1,87 +1,203 @@
 import os
+import heapq
 import numpy as np
 import geopandas as gpd
+import fiona
+from contextlib import ExitStack
 import rasterio
 from rasterio import features
-from shapely.geometry import shape
+from rasterio.windows import Window
+from shapely.geometry import MultiPolygon, shape, mapping
 from shapely.ops import unary_union
+from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from utils.windows import block_windows
+from utils.output import open_output
+from utils.sparsity import build_sparsity_index, data_windows
+from utils.parallel import imap_bounded, resolve_workers
+from modules.feature_cube import open_feature_cube, cube_band
 
-def filter_classification(ndvi_path, classification_path, analyseflaeche_path, ndvi_threshold, output_path):
-    print("Filter Klassifikation mit NDVI threshold..")
-    # --- Raster öffnen ---
+def _filter_block(ndvi, classification, ana, ndvi_threshold):
+    # Ergebnisraster initiieren
+    result = classification.copy()
+    nodata = 0
 
-    with rasterio.open(ndvi_path) as ndvi_raster, \
-         rasterio.open(classification_path) as classification_raster, \
-         rasterio.open(analyseflaeche_path) as ana_raster :
+    # NoData überall durchreichen (vor dem Überschreiben markieren)
+    mask_nodata = (ndvi == nodata) | (classification == nodata) | (ana == nodata)
+
+    # Filtern der Klassifkation für Nadelwald
+    result[(ndvi > ndvi_threshold) & (classification == 3) & (ana == 1) & ~mask_nodata] = 1
 
-        ndvi = ndvi_raster.read(1)
-        classification = classification_raster.read(1)
-        ana = ana_raster.read(1)
+    # Filtern der Klassifkation für sonstige Waldfläche
+    result[(ndvi > ndvi_threshold) & (classification == 3) & (ana > 1) & ~mask_nodata] = 4
 
-        # Ergebnisraster initiieren
-        result = classification.copy()
-        nodata = 0
+    # optional: sicherstellen, dass dtype passt
+    return result.astype("uint8")
 
-        # NoData überall durchreichen (vor dem Überschreiben markieren)
-        mask_nodata = (ndvi == nodata) | (classification == nodata) | (ana == nodata)
 
-        # Filtern der Klassifkation für Nadelwald
-        result[(ndvi > ndvi_threshold) & (classification == 3) & (ana == 1) & ~mask_nodata] = 1
+def filter_classification(ndvi_path, classification_path, analyseflaeche_path, ndvi_threshold, output_path,
+                          block_size=None, feature_cube=None, aoi_only=False):
+    """aoi_only: Ergebnis nur innerhalb der Analysefläche, außerhalb NoData statt der ungefilterten
+    Klassifikation. Blöcke ohne Analysefläche werden dabei nicht gelesen."""
+    print("Filter Klassifikation mit NDVI threshold..")
+    # --- Raster öffnen ---
 
-        # Filtern der Klassifkation für sonstige Waldfläche
-        result[(ndvi > ndvi_threshold) & (classification == 3) & (ana > 1) & ~mask_nodata] = 4
+    with ExitStack() as stack, \
+         rasterio.open(classification_path) as classification_raster, \
+         rasterio.open(analyseflaeche_path) as ana_raster :
 
-        # optional: sicherstellen, dass dtype passt
-        result = result.astype("uint8")
+        # NDVI aus dem Merkmalswürfel (Sicht ohne Dekodieren) oder aus dem GeoTIFF
+        if feature_cube is not None:
+            ndvi = cube_band(open_feature_cube(feature_cube), "ndvi")
+            if ndvi.shape != classification_raster.shape:
+                raise ValueError("Merkmalswürfel und Klassifikation müssen dieselbe Rastergröße haben.")
+            read_ndvi = lambda window=None: ndvi if window is None else ndvi[window.toslices()]
+        else:
+            ndvi_raster = stack.enter_context(rasterio.open(ndvi_path))
+            read_ndvi = lambda window=None: ndvi_raster.read(1, window=window)
 
-        # --- Ergebnis speichern ---
         out_meta = classification_raster.meta.copy()
         out_meta.update({
             "dtype": "uint8",
             "nodata": 0,
-            "count": 1,
-            "compress": "lzw"
+            "count": 1
         })
 
-        # save raster
-        with rasterio.open(output_path, "w", **out_meta) as dst:
-            dst.write(result, 1)
+        if block_size or aoi_only:
+            windows = block_windows(classification_raster, block_size)
+            if aoi_only:
+                windows = data_windows(build_sparsity_index(analyseflaeche_path, classification_raster, windows))
+
+            # Blockweise lesen, filtern und schreiben (nicht geschriebene Blöcke bleiben NoData)
+            with open_output(output_path, out_meta, block_size) as dst:
+                for window in windows:
+                    ana = ana_raster.read(1, window=window)
+                    result = _filter_block(read_ndvi(window), classification_raster.read(1, window=window),
+                                           ana, ndvi_threshold)
+                    if aoi_only:
+                        result[ana == 0] = 0
+                    dst.write(result, 1, window=window)
+        else:
+            result = _filter_block(read_ndvi(), classification_raster.read(1), ana_raster.read(1),
+                                   ndvi_threshold)
+
+            # save raster
+            with open_output(output_path, out_meta) as dst:
+                dst.write(result, 1)
 
     print(f"Ergebnis gespeichert unter: {output_path}")
     return output_path
 
-def _shared_border_len(a, b):
-    """Länge der gemeinsamen Grenze zweier Geometrien (0 wenn sie sich nicht berühren)."""
-    inter = a.boundary.intersection(b.boundary)
-    return inter.length if not inter.is_empty else 0.0
+def _shared_borders(gdf):
+    """Nachbarschaftsgraph mit Länge der gemeinsamen Grenze für alle sich berührenden Polygonpaare.
+
+    Die Paare kommen aus einem einzigen räumlichen Join, die Grenzlängen aus einer
+    elementweisen Verschneidung der Umringe. Gibt {i: {j: länge}} zurück.
+    """
+    cells = gpd.GeoDataFrame(geometry=gdf.geometry.values, crs=gdf.crs)
+    pairs = gpd.sjoin(cells, cells, predicate="intersects")
+    left = pairs.index.values
+    right = pairs["index_right"].values
+    keep = left < right
+    left, right = left[keep], right[keep]
+
+    boundaries = cells.geometry.boundary
+    lengths = boundaries.iloc[left].reset_index(drop=True).intersection(
+        boundaries.iloc[right].reset_index(drop=True), align=False).length.values
+
+    neighbours = {i: {} for i in range(len(gdf))}
+    for i, j, length in zip(left, right, lengths):
+        neighbours[i][j] = length
+        neighbours[j][i] = length
+    return neighbours
+
+
+def _merge_small_polygons(gdf, min_area):
+    """Merged Polygone kleiner min_area in ihren Nachbarn mit der längsten gemeinsamen Grenze.
+
+    Ohne berührenden Nachbarn wird in den nächstgelegenen Nachbarn gemergt. Das Ziel behält
+    seine Attribute. Kleine Flächen werden wie bisher in Reihenfolge ihres Index abgearbeitet;
+    ein Ziel, das nach dem Merge noch zu klein ist, wird erneut eingereiht.
+
+    Der Nachbarschaftsgraph wird nur einmal aufgebaut und bei jedem Merge fortgeschrieben
+    (Grenzlängen werden addiert). Die Geometrien jeder Gruppe werden am Ende mit einem
+    einzigen unary_union vereinigt.
+    """
+    n = len(gdf)
+    if n == 0:
+        return gdf
+    area = gdf.geometry.area.values.copy()
+    neighbours = _shared_borders(gdf)
+    members = {i: [i] for i in range(n)}
+    root = np.arange(n)
+
+    heap = [i for i in range(n) if area[i] < min_area]
+    heapq.heapify(heap)
+
+    while heap:
+        i = heapq.heappop(heap)
+        if i not in members or area[i] >= min_area:
+            continue
+        if len(members) == 1:
+            break
+
+        nbrs = neighbours[i]
+        if nbrs:
+            # Ziel: längste gemeinsame Grenze (bei Gleichstand kleinster Index)
+            target = max(nbrs, key=lambda j: (nbrs[j], -j))
+        else:
+            # ggf. auf alle anderen ausweichen: nächstgelegenes Polygon außerhalb der Gruppe
+            group_geom = unary_union(gdf.geometry.values[members[i]])
+            dists = np.array(gdf.geometry.distance(group_geom).values, dtype=float)
+            dists[members[i]] = np.inf
+            target = int(root[int(np.argmin(dists))])
+
+        # Merge: Ziel übernimmt Fläche, Mitglieder und Nachbarn
+        for k, length in nbrs.items():
+            del neighbours[k][i]
+            if k != target:
+                neighbours[target][k] = neighbours[target].get(k, 0.0) + length
+                neighbours[k][target] = neighbours[target][k]
+        del neighbours[i]
+
+        members[target].extend(members.pop(i))
+        root[members[target]] = target
+        area[target] += area[i]
+
+        if area[target] < min_area:
+            heapq.heappush(heap, target)
+
+    # Geometrien je Gruppe vereinigen, Ziel behält Attribute
+    targets = sorted(members)
+    geoms = [gdf.geometry.values[members[t][0]] if len(members[t]) == 1
+             else unary_union(gdf.geometry.values[members[t]]) for t in targets]
+
+    merged = gdf.iloc[targets].reset_index(drop=True)
+    merged = merged.set_geometry(gpd.GeoSeries(geoms, crs=gdf.crs))
+    return merged
+
+
+def _valid_mask(band, nodata):
+    # --- Maske bauen (NoData ausblenden) ---
+    if nodata is None:
+        return None
+    if isinstance(nodata, float) and np.isnan(nodata):
+        return ~np.isnan(band)
+    return band != nodata
 
 
-def vectorize_raster(
-    raster_path,
-    min_area=None,
-    output_path=None,
-    strict_int=True  # True => Fehler, wenn Werte nicht (nahezu) ganzzahlig sind
-):
-    # --- Raster lesen ---
-    with rasterio.open(raster_path) as src:
-        band1 = src.read(1)
-        transform = src.transform
-        nodata = src.nodata
-        crs = src.crs
+def _sieve_size(min_area, transform):
+    """Mindestfläche in Pixeln für den Sieve-Filter."""
+    pixel_area = abs(transform.a * transform.e - transform.b * transform.d)
+    return int(np.ceil(min_area / pixel_area))
 
-    # --- Maske bauen (NoData ausblenden) ---
-    if nodata is None:
-        mask = None
-    else:
-        if isinstance(nodata, float) and np.isnan(nodata):
-            mask = ~np.isnan(band1)
-        else:
-            mask = band1 != nodata
 
+def _polygonize(band, mask, transform, nodata):
     # --- Raster -> Vektoren ---
     geoms = []
     vals = []
-    for geom, val in features.shapes(band1, mask=mask, transform=transform):
+    for geom, val in features.shapes(band, mask=mask, transform=transform):
         # Sicherheitsfilter: NoData raus (auch wenn mask schon gesetzt ist)
         if nodata is not None:
             if isinstance(nodata, float) and np.isnan(nodata):
@@ -91,82 +207,76 @@ def vectorize_raster(
                 continue
         geoms.append(shape(geom))
         vals.append(val)
+    return geoms, vals
+
+
+def _scan_order(polygons):
+    """Sortiert (geometrie, klasse) nach dem obersten, linken Pixel jedes Polygons.
+
+    Die Reihenfolge von features.shapes hängt vom Ausschnitt ab. Mit dieser festen
+    Reihenfolge arbeitet _merge_small_polygons ganze und gekachelte Raster gleich ab.
+    """
+    def key(item):
+        coords = np.asarray(item[0].exterior.coords)
+        top = coords[:, 1].max()
+        return -top, coords[coords[:, 1] == top, 0].min()
+    return sorted(polygons, key=key)
+
 
+def _int_values(vals, strict_int):
     # --- Werte als int absichern ---
     vals = np.asarray(vals)
     if np.issubdtype(vals.dtype, np.floating):
         # sind die Werte praktisch ganzzahlig? (z.B. 1.0, 2.0)
         if np.all(np.isclose(vals, np.round(vals), equal_nan=False)):
-            vals = np.round(vals).astype(np.int64)
-        else:
-            if strict_int:
-                raise ValueError(
-                    "Rasterwerte sind nicht ganzzahlig. Setze strict_int=False, "
-                    "wenn du trotzdem runden und als int speichern willst."
-                )
-            vals = np.round(vals).astype(np.int64)
-    else:
-        vals = vals.astype(np.int64)
+            return np.round(vals).astype(np.int64)
+        if strict_int:
+            raise ValueError(
+                "Rasterwerte sind nicht ganzzahlig. Setze strict_int=False, "
+                "wenn du trotzdem runden und als int speichern willst."
+            )
+        return np.round(vals).astype(np.int64)
+    return vals.astype(np.int64)
+
+
+def vectorize_raster(
+    raster_path,
+    min_area=None,
+    output_path=None,
+    strict_int=True,  # True => Fehler, wenn Werte nicht (nahezu) ganzzahlig sind
+    sieve=False  # True => Mindestfläche bereits im Raster per Sieve-Filter anwenden
+):
+    # --- Raster lesen ---
+    with rasterio.open(raster_path) as src:
+        band1 = src.read(1)
+        transform = src.transform
+        nodata = src.nodata
+        crs = src.crs
+
+    mask = _valid_mask(band1, nodata)
+
+    # --- Mindestfläche im Raster (Sieve) ---
+    # Zusammenhängende Pixelgruppen kleiner min_area gehen im größten gültigen Nachbarn auf.
+    # NoData-Pixel werden weder verändert noch als Nachbar verwendet. Übrig bleiben nur
+    # kleine Flächen ohne gültigen Nachbarn, die unten wie bisher vektoriell gemergt werden.
+    if sieve and min_area and min_area > 0:
+        if not np.issubdtype(band1.dtype, np.integer):
+            raise ValueError("Sieve benötigt ganzzahlige Rasterwerte.")
+        size = _sieve_size(min_area, transform)
+        if size > 1:
+            band1 = features.sieve(band1, size=size, mask=mask, connectivity=4)
 
-    # --- GeoDataFrame ---
-    gdf = gpd.GeoDataFrame({"class": vals}, geometry=geoms, crs=crs).reset_index(drop=True)
+    geoms, vals = _polygonize(band1, mask, transform, nodata)
+    vals = _int_values(vals, strict_int)
+
+    # --- GeoDataFrame (feste Reihenfolge, gleiches Ergebnis wie gekachelt) ---
+    ordered = _scan_order(zip(geoms, vals))
+    gdf = gpd.GeoDataFrame({"class": [val for _, val in ordered]},
+                           geometry=[geom for geom, _ in ordered], crs=crs).reset_index(drop=True)
 
     # --- Kleine Flächen auf größere Nachbarn mergen ---
     if min_area and min_area > 0:
-        gdf["area"] = gdf.geometry.area
-        # Sicherheitslimit, um Endlosschleifen zu vermeiden
-        max_iters = len(gdf) * 2
-        it = 0
-
-        while True:
-            it += 1
-            if it > max_iters:
-                break
-
-            small = gdf.index[gdf["area"] < min_area]
-            if len(small) == 0:
-                break
-
-            i = int(small[0])
-            geom_i = gdf.geometry.iloc[i]
-
-            # Kandidaten per SIndex & bbox
-            sidx = gdf.sindex
-            cand = [j for j in sidx.intersection(geom_i.bounds) if j != i]
-
-            # Echte Nachbarn (touch/intersect)
-            touching = [j for j in cand
-                        if geom_i.touches(gdf.geometry.iloc[j]) or geom_i.intersects(gdf.geometry.iloc[j])]
-
-            # Ziel: längste gemeinsame Grenze -> sonst nächster Nachbar
-            target = None
-            if touching:
-                best_len = -1.0
-                for j in touching:
-                    l = _shared_border_len(geom_i, gdf.geometry.iloc[j])
-                    if l > best_len:
-                        best_len = l
-                        target = j
-            else:
-                # ggf. auf alle anderen ausweichen
-                others = [j for j in range(len(gdf)) if j != i]
-                if others:
-                    dists = [(j, geom_i.distance(gdf.geometry.iloc[j])) for j in others]
-                    target = min(dists, key=lambda x: x[1])[0]
-
-            if target is None:
-                # nichts Sinnvolles zu mergen
-                break
-
-            # Merge: Ziel behält Attribute
-            new_geom = unary_union([gdf.geometry.iloc[target], geom_i])
-            gdf.at[target, "geometry"] = new_geom
-            gdf.at[target, "area"] = new_geom.area
-
-            # kleines Polygon entfernen und Index neu aufsetzen
-            gdf = gdf.drop(index=i).reset_index(drop=True)
-
-        gdf = gdf.drop(columns="area")
+        gdf = _merge_small_polygons(gdf, min_area)
 
     # --- Ausgabe ---
     if output_path is None:
@@ -177,3 +287,224 @@ def vectorize_raster(
     gdf.to_file(output_path)
 
     return output_path
+
+
+# Zustand der Worker-Prozesse für die gekachelte Vektorisierung
+_worker_state = {}
+
+# Treiber für gestreamte Vektorausgaben, gewählt anhand der Dateiendung
+_STREAM_DRIVERS = {".gpkg": "GPKG", ".fgb": "FlatGeobuf"}
+
+
+def _init_tile_worker(raster_path, sieve_size, strict_int):
+    _worker_state["src"] = rasterio.open(raster_path)
+    # Raster beim Beenden des Worker-Prozesses schließen
+    Finalize(None, _worker_state["src"].close, exitpriority=10)
+    _worker_state["sieve_size"] = sieve_size
+    _worker_state["strict_int"] = strict_int
+
+
+def _polygonize_tile(window):
+    """Vektorisiert eine Kachel im Worker-Prozess.
+
+    Gibt (Fenster, fertige Polygone, Nahtpolygone) zurück, Polygone als Listen von
+    (geometrie, klasse).
+    Nahtpolygone berühren einen inneren Kachelrand und werden später über die Naht
+    hinweg mit ihren Nachbarn gleicher Klasse verschmolzen.
+    """
+    src = _worker_state["src"]
+    sieve_size = _worker_state["sieve_size"]
+    full = Window(0, 0, src.width, src.height)
+
+    if sieve_size > 1:
+        # Sieve mit Randzone, damit kleine Flächen an der Kachelgrenze vollständig sichtbar sind
+        halo = min(sieve_size, max(window.width, window.height))
+        outer = Window(window.col_off - halo, window.row_off - halo,
+                       window.width + 2 * halo, window.height + 2 * halo).intersection(full)
+        band = src.read(1, window=outer)
+        band = features.sieve(band, size=sieve_size, mask=_valid_mask(band, src.nodata), connectivity=4)
+        row0 = int(window.row_off - outer.row_off)
+        col0 = int(window.col_off - outer.col_off)
+        band = band[row0:row0 + int(window.height), col0:col0 + int(window.width)]
+    else:
+        band = src.read(1, window=window)
+
+    transform = src.window_transform(window)
+    geoms, vals = _polygonize(band, _valid_mask(band, src.nodata), transform, src.nodata)
+    vals = _int_values(vals, _worker_state["strict_int"])
+
+    # Innere Kachelränder (Rasterränder sind keine Nähte)
+    left, bottom, right, top = rasterio.windows.bounds(window, src.transform)
+    seams = []
+    if window.col_off > 0:
+        seams.append(("minx", left))
+    if window.col_off + window.width < src.width:
+        seams.append(("maxx", right))
+    if window.row_off > 0:
+        seams.append(("maxy", top))
+    if window.row_off + window.height < src.height:
+        seams.append(("miny", bottom))
+    tol = abs(src.transform.a) / 2
+
+    complete, seam = [], []
+    for geom, val in zip(geoms, vals):
+        minx, miny, maxx, maxy = geom.bounds
+        coords = {"minx": minx, "miny": miny, "maxx": maxx, "maxy": maxy}
+        if any(abs(coords[side] - edge) < tol for side, edge in seams):
+            seam.append((geom, int(val)))
+        else:
+            complete.append((geom, int(val)))
+    return window, complete, seam
+
+
+def _stitch_seams(seam_polygons, crs):
+    """Verschmilzt Nahtpolygone gleicher Klasse, die eine gemeinsame Kante haben."""
+    if not seam_polygons:
+        return []
+    geoms, vals = zip(*seam_polygons)
+    gdf = gpd.GeoDataFrame({"class": list(vals)}, geometry=list(geoms), crs=crs)
+    neighbours = _shared_borders(gdf)
+
+    # Union-Find über alle Paare mit gleicher Klasse und gemeinsamer Kante
+    parent = list(range(len(gdf)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    classes = gdf["class"].values
+    for i, nbrs in neighbours.items():
+        for j, length in nbrs.items():
+            if length > 0 and classes[i] == classes[j]:
+                parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(gdf)):
+        groups.setdefault(find(i), []).append(i)
+
+    stitched = []
+    for members in groups.values():
+        geom = gdf.geometry.values[members[0]] if len(members) == 1 \
+            else unary_union(gdf.geometry.values[members])
+        stitched.append((geom, int(classes[members[0]])))
+    return stitched
+
+
+def _records(polygons):
+    for geom, val in polygons:
+        # Gemergte Gruppen sind nicht immer zusammenhängend (nächster Nachbar, Eckkontakt) und
+        # bleiben ein Feature wie bei vectorize_raster, daher einheitlich als MultiPolygon
+        if geom.geom_type == "Polygon":
+            geom = MultiPolygon([geom])
+        yield {"geometry": mapping(geom), "properties": {"class": val}}
+
+
+def vectorize_raster_tiled(
+    raster_path,
+    min_area=None,
+    output_path=None,
+    strict_int=True,
+    tile_size=2048,
+    n_workers=None,
+    batch_size=10000,
+    sieve=False
+):
+    """Gekachelte, parallele Vektorisierung mit gestreamter Ausgabe.
+
+    Die Kacheln werden in einem Prozesspool vektorisiert. Polygone, die keinen inneren
+    Kachelrand berühren, werden in Blöcken von batch_size direkt in die Ausgabe geschrieben.
+    Polygone an den Nähten werden je Kachelzeile über gemeinsame Kanten verschmolzen,
+    sobald alle Kachelzeilen bis dahin fertig sind. Geschrieben werden sie, sobald sie die
+    nächste Kachelzeile nicht mehr berühren, im Speicher bleiben also nur etwa die
+    Nahtpolygone einer Kachelzeile. Ausgabe als GeoPackage (.gpkg) oder FlatGeobuf (.fgb)
+    mit räumlichem Index, ein MultiPolygon-Feature je Fläche bzw. gemergter Gruppe.
+
+    min_area wird wie bei vectorize_raster angewendet:
+    sieve=True: als Sieve im Raster (mit Randzone je Kachel), gestreamt mit flachem
+        Speicherbedarf. Nahe der Kachelgrenzen kann der Sieve eine kleine Fläche einem
+        anderen Nachbarn zuordnen als ein Sieve über das gesamte Raster, da große Nachbarn
+        nur ausschnittsweise sichtbar sind. Kleine Flächen ohne gültigen Nachbarn bleiben
+        erhalten (vectorize_raster mergt sie anschließend vektoriell).
+    sieve=False: vektorielles Mergen kleiner Polygone (_merge_small_polygons) über die
+        zusammengesetzte Ausgabe, gleiche Polygone wie vectorize_raster. Dafür werden alle
+        Polygone bis zum Ende gesammelt, nur die Vektorisierung läuft parallel.
+    """
+    if output_path is None:
+        base, _ = os.path.splitext(raster_path)
+        output_path = base + "_vectorized.gpkg"
+
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in _STREAM_DRIVERS:
+        raise ValueError(f"Gekachelte Vektorisierung schreibt nur {', '.join(_STREAM_DRIVERS)}, nicht '{extension}'.")
+
+    n_workers = resolve_workers(n_workers)
+    with rasterio.open(raster_path) as src:
+        crs = src.crs
+        windows = list(block_windows(src, tile_size))
+        height = src.height
+        # Unterkante jeder Kachelzeile (Rasterkoordinaten)
+        row_bottom = [src.xy(min(row_off + tile_size, height), 0, offset="ul")[1]
+                      for row_off in range(0, height, tile_size)]
+        tol = abs(src.transform.a) / 2
+        merge = bool(min_area and min_area > 0 and not sieve)
+        sieve_size = _sieve_size(min_area, src.transform) if sieve and min_area and min_area > 0 else 0
+        if sieve_size > 1 and not np.issubdtype(np.dtype(src.dtypes[0]), np.integer):
+            raise ValueError("Sieve benötigt ganzzahlige Rasterwerte.")
+
+    n_rows = len(row_bottom)
+    tiles_per_row = len(windows) // n_rows
+    schema = {"geometry": "MultiPolygon", "properties": {"class": "int"}}
+    # Nahtpolygone je Kachelzeile und verschmolzene, noch offene Gruppen der fertigen Zeilen
+    seam_rows = {}
+    done_tiles = [0] * n_rows
+    open_groups = []
+    next_row = 0
+    collected = []
+    batch = []
+
+    with fiona.open(output_path, "w", driver=_STREAM_DRIVERS[extension], schema=schema,
+                    crs_wkt=crs.to_wkt(), SPATIAL_INDEX="YES") as dst, \
+         ProcessPoolExecutor(max_workers=n_workers,
+                             initializer=_init_tile_worker,
+                             initargs=(raster_path, sieve_size, strict_int)) as executor:
+
+        def emit(polygons):
+            nonlocal batch
+            if merge:
+                # vektorielles Mergen braucht alle Polygone
+                collected.extend(polygons)
+                return
+            batch.extend(_records(polygons))
+            if len(batch) >= batch_size:
+                dst.writerecords(batch)
+                batch = []
+
+        results = imap_bounded(executor, _polygonize_tile, windows, max_pending=2 * n_workers)
+        for window, complete, seam in tqdm(results, total=len(windows), desc="Vektorisiere Kacheln"):
+            row = int(window.row_off) // tile_size
+            seam_rows.setdefault(row, []).extend(seam)
+            done_tiles[row] += 1
+            emit(complete)
+
+            # Fertige Kachelzeilen in Reihenfolge verschmelzen
+            while next_row < n_rows and done_tiles[next_row] == tiles_per_row:
+                groups = _stitch_seams(open_groups + seam_rows.pop(next_row, []), crs)
+                last = next_row == n_rows - 1
+                # Gruppen an der Unterkante können noch mit der nächsten Zeile verschmelzen
+                open_groups = [g for g in groups if not last and abs(g[0].bounds[1] - row_bottom[next_row]) < tol]
+                emit([g for g in groups if last or abs(g[0].bounds[1] - row_bottom[next_row]) >= tol])
+                next_row += 1
+
+        if merge:
+            ordered = _scan_order(collected)
+            gdf = gpd.GeoDataFrame({"class": [val for _, val in ordered]},
+                                   geometry=[geom for geom, _ in ordered], crs=crs)
+            gdf = _merge_small_polygons(gdf, min_area)
+            batch = list(_records(zip(gdf.geometry.values, gdf["class"].astype(int).tolist())))
+        for start in range(0, len(batch), batch_size):
+            dst.writerecords(batch[start:start + batch_size])
+
+    print(f"Ergebnis gespeichert unter: {output_path}")
+    return output_path
@@ -0,0 +1,135 @@
+import json
+import os
+from types import SimpleNamespace
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.windows import Window
+from tqdm import tqdm
+from utils.cache import file_fingerprint
+from utils.grid import same_grid
+
+# Version des Speicherformats, bei Änderungen erhöhen
+CUBE_VERSION = 1
+
+# Bänder in der Reihenfolge des Merkmalsvektors (Klassifikation und Würfel)
+BAND_NAMES = ["nbr", "ndvi", "ndwi", "dswi", "swir1"]
+
+# Zeilen pro Block beim Aufbau und beim Klassifizieren (ca. 1 Mio. Pixel je Block)
+_BLOCK_PIXELS = 2 ** 20
+
+
+def _cube_files(cube_dir):
+    return (os.path.join(cube_dir, "cube.npy"),
+            os.path.join(cube_dir, "mask.npy"),
+            os.path.join(cube_dir, "meta.json"))
+
+
+def build_feature_cube(band_paths, cube_dir):
+    """Schreibt die FORCE-Bänder einmalig als pixelweise verschachtelten float32-Würfel.
+
+    cube.npy hat die Form (Zeilen, Spalten, Bänder) in der Reihenfolge von band_paths, sodass
+    ein Zeilenblock direkt als Merkmalsmatrix (Pixel x Bänder) gelesen werden kann.
+    mask.npy markiert NoData-Pixel (NoData oder NaN in mindestens einem Band), meta.json
+    enthält Gitter und Fingerabdrücke der Quellbänder. Ist der Würfel zu den Quellen
+    aktuell, wird nichts neu geschrieben.
+
+    band_paths: dict Bandname -> Pfad, in der Reihenfolge des Merkmalsvektors.
+    """
+    cube_path, mask_path, meta_path = _cube_files(cube_dir)
+    names = list(band_paths)
+    fingerprints = [file_fingerprint(path) for path in band_paths.values()]
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["version"] == CUBE_VERSION and meta["bands"] == names and meta["fingerprints"] == fingerprints:
+            print(f"Merkmalswürfel aktuell: {cube_dir}")
+            return cube_dir
+
+    print("Erstelle Merkmalswürfel..")
+    os.makedirs(cube_dir, exist_ok=True)
+    rasters = [rasterio.open(path) for path in band_paths.values()]
+    ref = rasters[0]
+    assert all(same_grid(r, ref) for r in rasters), "Alle Bänder müssen auf demselben Gitter liegen"
+
+    height, width = ref.shape
+    cube = np.lib.format.open_memmap(cube_path, mode="w+", dtype=np.float32, shape=(height, width, len(names)))
+    mask = np.lib.format.open_memmap(mask_path, mode="w+", dtype=bool, shape=(height, width))
+    nodata_values = [r.nodata for r in rasters]
+
+    block_rows = max(1, _BLOCK_PIXELS // width)
+    for row in tqdm(range(0, height, block_rows), desc="Schreibe Merkmalswürfel"):
+        window = Window(0, row, width, min(block_rows, height - row))
+        block_mask = np.zeros((window.height, width), dtype=bool)
+        for i, (r, nodata) in enumerate(zip(rasters, nodata_values)):
+            band = r.read(1, window=window)
+            block_mask |= (band == nodata) | np.isnan(band)
+            cube[row:row + window.height, :, i] = band
+        mask[row:row + window.height] = block_mask
+
+    cube.flush()
+    mask.flush()
+    del cube, mask
+
+    meta = {
+        "version": CUBE_VERSION,
+        "bands": names,
+        "nodata": nodata_values,
+        "height": height,
+        "width": width,
+        "block_rows": block_rows,
+        "crs": ref.crs.to_wkt(),
+        "transform": list(ref.transform)[:6],
+        "fingerprints": fingerprints,
+    }
+    for r in rasters:
+        r.close()
+
+    # meta.json zuletzt schreiben, damit abgebrochene Läufe nicht als aktuell gelten
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Merkmalswürfel gespeichert unter: {cube_dir}")
+    return cube_dir
+
+
+def open_feature_cube(cube_dir):
+    """Öffnet einen Merkmalswürfel schreibgeschützt als Memory-Map (ohne Kopie der Daten).
+
+    Gibt ein dict mit data (Zeilen x Spalten x Bänder), mask, bands und profile zurück.
+    """
+    cube_path, mask_path, meta_path = _cube_files(cube_dir)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta["version"] != CUBE_VERSION:
+        raise ValueError(f"Merkmalswürfel {cube_dir} hat Version {meta['version']}, erwartet wird {CUBE_VERSION}.")
+
+    profile = {
+        "driver": "GTiff",
+        "height": meta["height"],
+        "width": meta["width"],
+        "count": 1,
+        "crs": CRS.from_wkt(meta["crs"]),
+        "transform": Affine(*meta["transform"]),
+    }
+    return {
+        "data": np.load(cube_path, mmap_mode="r"),
+        "mask": np.load(mask_path, mmap_mode="r"),
+        "bands": meta["bands"],
+        "block_rows": meta["block_rows"],
+        "profile": profile,
+    }
+
+
+def cube_band(cube, name):
+    """Ein Band des Würfels als Sicht (ohne Kopie)."""
+    return cube["data"][:, :, cube["bands"].index(name)]
+
+
+def cube_grid(cube):
+    """Pixelgitter des Würfels (crs, transform, width, height), z.B. als Referenz für utils.grid.open_aligned."""
+    profile = cube["profile"]
+    return SimpleNamespace(crs=profile["crs"], transform=profile["transform"],
+                           width=profile["width"], height=profile["height"])
@@ -8,13 +8,217 @@ from sklearn.model_selection import StratifiedKFold
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import classification_report
+import joblib
 from collections import Counter
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from rasterio.windows import Window
+from utils.windows import block_windows
+from utils.cache import file_fingerprint, cache_key
+from utils.output import open_output
+from modules.feature_cube import BAND_NAMES, open_feature_cube, cube_grid
+from utils.grid import open_aligned
+from utils.sparsity import build_sparsity_index, data_windows
+from utils.parallel import imap_bounded, resolve_workers
 
+# Version des gespeicherten Modellartefakts, bei Änderungen am Inhalt erhöhen
+MODEL_VERSION = 2
+
+# Zustand der Worker-Prozesse für die blockweise Klassifikation
+_worker_state = {}
+
+
+def _nodata_mask(stack, nodata_values):
+    mask = np.zeros(stack.shape[0], dtype=bool)
+    for i, nodata in enumerate(nodata_values):
+        band = stack[:, i]
+        mask |= (band == nodata) | np.isnan(band)
+    return mask
+
+
+def compile_predictor(scaler, clf):
+    """Fasst StandardScaler und LogisticRegression zu einem linearen Modell zusammen.
+
+    Die Standardisierung (x - mean) / scale wird einmalig in Gewichte und Achsenabschnitt
+    gefaltet, sodass die Vorhersage nur noch eine float32-Matrixmultiplikation und ein
+    argmax pro Pixel ist.
+    """
+    coef = np.asarray(clf.coef_, dtype=np.float64)
+    mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(coef.shape[1])
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones(coef.shape[1])
+
+    weights = coef / scale
+    intercept = clf.intercept_ - weights @ mean
+
+    return {
+        "weights": weights.T.astype(np.float32),
+        "intercept": intercept.astype(np.float32),
+        "classes": np.asarray(clf.classes_),
+    }
+
+
+def predict_pixels(predictor, X):
+    """Klassifiziert eine Pixelmatrix (n_pixel x n_baender) mit dem gefalteten Modell."""
+    scores = X.astype(np.float32, copy=False) @ predictor["weights"]
+    scores += predictor["intercept"]
+
+    if scores.shape[1] == 1:
+        # Binärer Fall: positive Entscheidungsfunktion -> zweite Klasse
+        idx = (scores[:, 0] > 0).astype(np.intp)
+    else:
+        idx = scores.argmax(axis=1)
+    return predictor["classes"][idx]
+
+
+def _init_classification_worker(raster_paths, predictor, aoi_path=None):
+    _worker_state["rasters"] = [rasterio.open(p) for p in raster_paths]
+    _worker_state["nodata_values"] = [r.nodata for r in _worker_state["rasters"]]
+    _worker_state["predictor"] = predictor
+    _worker_state["aoi"] = open_aligned(aoi_path, _worker_state["rasters"][0]) if aoi_path else None
+
+
+def _classify_window(window):
+    """Klassifiziert ein Fenster im Worker-Prozess und gibt (window, Ergebnisblock) zurück."""
+    rasters = _worker_state["rasters"]
+    stack = np.stack([r.read(1, window=window).ravel() for r in rasters], axis=1)
+
+    mask = _nodata_mask(stack, _worker_state["nodata_values"])
+    if _worker_state["aoi"] is not None:
+        mask |= _worker_state["aoi"].read(1, window=window).ravel() == 0
+    output = np.zeros(stack.shape[0], dtype=np.uint8)
+
+    if not mask.all():
+        output[~mask] = predict_pixels(_worker_state["predictor"], stack[~mask])
+
+    return window, output.reshape(window.height, window.width)
+
+
+def _init_cube_worker(cube_dir, predictor, aoi_path=None):
+    _worker_state["cube"] = open_feature_cube(cube_dir)
+    _worker_state["predictor"] = predictor
+    _worker_state["aoi"] = open_aligned(aoi_path, cube_grid(_worker_state["cube"])) if aoi_path else None
+
+
+def _classify_cube_window(window):
+    """Klassifiziert ein Fenster des Merkmalswürfels und gibt (window, Ergebnisblock) zurück."""
+    cube = _worker_state["cube"]
+    rows, cols = window.toslices()
+    block = cube["data"][rows, cols]
+    X = block.reshape(-1, block.shape[2])  # volle Zeilen -> Sicht ohne Kopie
+    mask = cube["mask"][rows, cols].ravel()
+    if _worker_state["aoi"] is not None:
+        mask = mask | (_worker_state["aoi"].read(1, window=window).ravel() == 0)
+
+    output = np.zeros(X.shape[0], dtype=np.uint8)
+    if not mask.all():
+        output[~mask] = predict_pixels(_worker_state["predictor"], X[~mask])
+    return window, output.reshape(block.shape[0], block.shape[1])
+
+
+def _classify_cube(cube_dir, predictor, output_path, n_workers=None, aoi_path=None):
+    """Klassifikation aus dem Merkmalswürfel: Zeilenblöcke werden ohne Dekodieren und Stapeln gelesen."""
+    cube = open_feature_cube(cube_dir)
+    if cube["bands"] != BAND_NAMES:
+        raise ValueError(f"Merkmalswürfel {cube_dir} enthält die Bänder {cube['bands']}, erwartet {BAND_NAMES}.")
+    height, width = cube["profile"]["height"], cube["profile"]["width"]
+    block_rows = cube["block_rows"]
+    windows = [Window(0, row, width, min(block_rows, height - row)) for row in range(0, height, block_rows)]
+    if aoi_path is not None:
+        windows = data_windows(build_sparsity_index(aoi_path, cube_grid(cube), windows))
+
+    meta = cube["profile"].copy()
+    meta.update(dtype='uint8', count=1, nodata=0)
+    n_workers = resolve_workers(n_workers)
+
+    with open_output(output_path, meta) as dst, \
+         ProcessPoolExecutor(max_workers=n_workers,
+                             initializer=_init_cube_worker,
+                             initargs=(cube_dir, predictor, aoi_path)) as executor:
+        results = imap_bounded(executor, _classify_cube_window, windows, max_pending=2 * n_workers)
+        for window, block in tqdm(results, total=len(windows), desc="Klassifiziere Merkmalswürfel"):
+            dst.write(block, 1, window=window)
+
+
+def _classify_windowed(raster_paths, predictor, meta, output_path, n_workers=None, aoi_path=None):
+    """Blockweise Klassifikation über einen Prozesspool.
+
+    Jeder Worker hält das gefaltete Modell sowie eigene Dateihandles der Raster. Fertige Blöcke
+    werden direkt ins Ausgaberaster geschrieben, der Speicherbedarf hängt damit nur von
+    Blockgröße und Workeranzahl ab. Mit aoi_path werden nur die engen Fenster der Blöcke mit
+    Analysefläche gelesen und klassifiziert.
+    """
+    n_workers = resolve_workers(n_workers)
+
+    with rasterio.open(raster_paths[0]) as ref:
+        windows = list(block_windows(ref))
+        if aoi_path is not None:
+            windows = data_windows(build_sparsity_index(aoi_path, ref, windows))
+
+    with open_output(output_path, meta) as dst, \
+         ProcessPoolExecutor(max_workers=n_workers,
+                             initializer=_init_classification_worker,
+                             initargs=(raster_paths, predictor, aoi_path)) as executor:
+        results = imap_bounded(executor, _classify_window, windows, max_pending=2 * n_workers)
+        for window, block in tqdm(results, total=len(windows), desc="Klassifiziere Rasterblöcke"):
+            dst.write(block, 1, window=window)
+
+
+def _sample_raster(r, xs, ys):
+    """Rasterwerte an allen Punkten, gelesen wird nur je ein Fenster pro betroffenem internen Block."""
+    cols, rows = ~r.transform * (xs, ys)
+    rows = np.floor(rows).astype(np.int64)
+    cols = np.floor(cols).astype(np.int64)
+
+    # Punkte außerhalb des Rasters erhalten NoData (wie bei r.sample)
+    fill = r.nodata if r.nodata is not None else 0
+    values = np.full(len(xs), fill, dtype=r.dtypes[0])
+    inside = np.flatnonzero((rows >= 0) & (rows < r.height) & (cols >= 0) & (cols < r.width))
+
+    block_height, block_width = r.block_shapes[0]
+    block_ids = (rows[inside] // block_height) * r.width + cols[inside] // block_width
+    order = np.argsort(block_ids, kind="stable")
+    inside, block_ids = inside[order], block_ids[order]
+    starts = np.flatnonzero(np.r_[True, block_ids[1:] != block_ids[:-1]])
+
+    for start, end in zip(starts, np.r_[starts[1:], len(inside)]):
+        idx = inside[start:end]
+        row_off = rows[idx[0]] // block_height * block_height
+        col_off = cols[idx[0]] // block_width * block_width
+        window = Window(col_off, row_off, min(block_width, r.width - col_off), min(block_height, r.height - row_off))
+        data = r.read(1, window=window)
+        values[idx] = data[rows[idx] - row_off, cols[idx] - col_off]
+
+    return values
+
+
+def _vector_files(path):
+    """Alle Dateien eines Vektordatensatzes (beim Shapefile inkl. .dbf, .shx, .prj, ...)."""
+    base, extension = os.path.splitext(path)
+    if extension.lower() != ".shp":
+        return [path]
+    folder = os.path.dirname(path) or "."
+    stem = os.path.basename(base)
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if os.path.splitext(name)[0] == stem)
+
+
+def load_training_samples(raster_paths, training_points, class_attribute, cache_dir=None):
+    """Merkmalsmatrix X und Klassen y an den Trainingspunkten.
+
+    Mit cache_dir wird das Ergebnis als .npz abgelegt, Schlüssel sind die Fingerabdrücke
+    der Trainingsdaten und Bänder sowie class_attribute. Unveränderte Eingaben werden
+    beim nächsten Lauf direkt aus dem Cache geladen.
+    """
+    cache_path = None
+    if cache_dir is not None:
+        key = cache_key([file_fingerprint(p) for p in _vector_files(training_points)], class_attribute,
+                        [file_fingerprint(p) for p in raster_paths])
+        cache_path = os.path.join(cache_dir, f"samples_{key}.npz")
+        if os.path.exists(cache_path):
+            print("Trainingsdaten aus Cache geladen.")
+            with np.load(cache_path) as cached:
+                return cached["X"], cached["y"]
 
-def run_maxent(ndvi_path, ndwi_path, nbr_path, dswi_path, sw1_path, training_points, class_attribute, output_path=None):
-    raster_paths = [nbr_path, ndvi_path, ndwi_path, dswi_path, sw1_path]
-    n_splits = 5
-    # ---------- 1. Daten vorbereiten ----------
     # Raster öffnen
     rasters = [rasterio.open(r) for r in raster_paths]
     assert all((r.shape == rasters[0].shape for r in rasters)), "Alle Raster müssen gleiche Form haben"
@@ -22,47 +226,117 @@ def run_maxent(ndvi_path, ndwi_path, nbr_path, dswi_path, sw1_path, training_poi
     # CRS abgleichen
     raster_crs = rasters[0].crs
     gdf = gpd.read_file(training_points).to_crs(raster_crs)
-    coords = [(geom.x, geom.y) for geom in gdf.geometry]
+    xs = gdf.geometry.x.values
+    ys = gdf.geometry.y.values
 
     # Rasterwerte extrahieren
-    samples = [np.array([val[0] for val in r.sample(coords)]) for r in rasters]
+    samples = [_sample_raster(r, xs, ys) for r in rasters]
     X = np.stack(samples, axis=1)
     y = gdf[class_attribute].astype(int).values
 
-    # ---------- 2. Kreuzvalidierung vorbereiten ----------
+    for r in rasters:
+        r.close()
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # atomar ersetzen, der Cache kann von parallelen Läufen geteilt werden
+        tmp_path = os.path.join(cache_dir, f"samples_{key}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, X=X, y=y)
+        os.replace(tmp_path, cache_path)
+    return X, y
+
+
+def _make_classifier():
+    return LogisticRegression(
+        penalty='l2',
+        solver='saga',
+        multi_class='multinomial',
+        #class_weight='balanced',
+        max_iter=2000,
+        random_state=42
+    )
+
+
+def _run_fold(fold_data):
+    """Trainiert und bewertet einen Fold der Kreuzvalidierung (im Worker-Prozess)."""
+    X_train, X_test, y_train, y_test = fold_data
+
+    # Skalieren
     scaler = StandardScaler()
-    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    # Modell trainieren
+    clf = _make_classifier()
+    clf.fit(X_train_scaled, y_train)
+
+    # Evaluation
+    y_pred = clf.predict(X_test_scaled)
+    return classification_report(y_test, y_pred, digits=3, output_dict=True)
+
+
+def save_model(model, model_path):
+    """Speichert das Modellartefakt (scaler, clf, Klassen, Bewertung) mit joblib."""
+    folder = os.path.dirname(model_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    joblib.dump(model, model_path)
+    print(f"Modell gespeichert unter: {model_path}")
+    return model_path
+
+
+def load_model(model_path):
+    """Lädt ein mit save_model gespeichertes Modellartefakt und prüft dessen Version."""
+    model = joblib.load(model_path)
+    if model.get("version") != MODEL_VERSION:
+        raise ValueError(f"Modell {model_path} hat Version {model.get('version')}, erwartet wird {MODEL_VERSION}. "
+                         f"Bitte neu trainieren.")
+    return model
 
-    all_reports = []
 
-    for fold, (train_idx, test_idx) in enumerate(skf.split(X, y), 1):
+def _training_fingerprint(training_points, class_attribute):
+    return cache_key([file_fingerprint(p) for p in _vector_files(training_points)], class_attribute)
 
-        # Splitten und Skalieren
-        X_train, X_test = X[train_idx], X[test_idx]
-        y_train, y_test = y[train_idx], y[test_idx]
 
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
+def load_current_model(model_path, training_points, class_attribute):
+    """Lädt das Modell aus model_path, wenn es zu den Trainingspunkten und class_attribute passt.
 
-        # Modell trainieren
-        clf = LogisticRegression(
-            penalty='l2',
-            solver='saga',
-            multi_class='multinomial',
-            #class_weight='balanced',
-            max_iter=2000,
-            random_state=42
-        )
-        clf.fit(X_train_scaled, y_train)
+    Gibt None zurück, wenn die Datei fehlt oder das Modell mit anderen Trainingsdaten bzw.
+    einem anderen Klassenattribut trainiert wurde (dann neu trainieren). Ohne vorhandene
+    Trainingspunkte (reine Vorhersage) wird das Modell ungeprüft verwendet.
+    """
+    if not model_path or not os.path.exists(model_path):
+        return None
+    model = load_model(model_path)
+    if training_points and os.path.exists(training_points) and \
+            model["training_fingerprint"] != _training_fingerprint(training_points, class_attribute):
+        print(f"Modell {model_path} wurde mit anderen Trainingspunkten oder einem anderen Klassenattribut "
+              f"trainiert und wird neu trainiert.")
+        return None
+    return model
 
-        # Evaluation
-        y_pred = clf.predict(X_test_scaled)
-        report = classification_report(y_test, y_pred, digits=3, output_dict=True)
 
-        all_reports.append(report)
+def train_maxent(raster_paths, training_points, class_attribute, cache_dir=None, n_workers=None, model_path=None):
+    """Trainiert das Modell auf den Trainingspunkten und gibt das Modellartefakt zurück.
+
+    raster_paths in der Reihenfolge nbr, ndvi, ndwi, dswi, swir1 (siehe band_order).
+    cache_dir: Ablage für die extrahierten Trainingsdaten (siehe load_training_samples).
+    n_workers: Prozesse für die Kreuzvalidierung, die Folds laufen parallel.
+    model_path: wenn gesetzt, wird das Artefakt dort gespeichert (siehe load_model).
+    """
+    n_splits = 5
+    # ---------- 1. Daten vorbereiten ----------
+    X, y = load_training_samples(raster_paths, training_points, class_attribute, cache_dir)
+
+    # ---------- 2. Kreuzvalidierung (Folds parallel) ----------
+    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+    folds = [(X[train_idx], X[test_idx], y[train_idx], y[test_idx]) for train_idx, test_idx in skf.split(X, y)]
+
+    with ProcessPoolExecutor(max_workers=min(n_splits, resolve_workers(n_workers))) as executor:
+        all_reports = list(executor.map(_run_fold, folds))
 
     # ---------- 3. Durchschnittliche Bewertung (optional) ----------
-    # z. B. mittlere F1-Score über alle Folds berechnen
+    # z. B. mittlere F1-Score über alle Folds berechnen
     classes = sorted(np.unique(y))
     avg_f1 = {cls: np.mean([rep[str(cls)]['f1-score'] for rep in all_reports]) for cls in classes}
 
@@ -71,38 +345,113 @@ def run_maxent(ndvi_path, ndwi_path, nbr_path, dswi_path, sw1_path, training_poi
         print(f"  Klasse {cls}: {score:.3f}")
 
     # ---------- 3. Finales Modell auf allen Daten ----------
+    scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
+    clf = _make_classifier()
     clf.fit(X_scaled, y)
 
+    # Scaler und Modell für die Rasterklassifikation zusammenfassen
+    predictor = compile_predictor(scaler, clf)
+    n_diff = np.count_nonzero(predict_pixels(predictor, X) != clf.predict(X_scaled))
+    if n_diff:
+        print(f"⚠️ Gefaltetes Modell weicht bei {n_diff} von {len(y)} Trainingspunkten von clf.predict ab.")
+
+    model = {
+        "version": MODEL_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "bands": BAND_NAMES,
+        "training_points": training_points,
+        "class_attribute": class_attribute,
+        "training_fingerprint": _training_fingerprint(training_points, class_attribute),
+        "classes": [int(cls) for cls in classes],
+        "scaler": scaler,
+        "clf": clf,
+        "predictor": predictor,
+        "fold_reports": all_reports,
+        "avg_f1": {int(cls): float(score) for cls, score in avg_f1.items()},
+    }
+    if model_path is not None:
+        save_model(model, model_path)
+    return model
+
+
+def band_order(ndvi_path, ndwi_path, nbr_path, dswi_path, sw1_path):
+    """Reihenfolge der Bänder im Merkmalsvektor des Modells (siehe BAND_NAMES)."""
+    return [nbr_path, ndvi_path, ndwi_path, dswi_path, sw1_path]
+
+
+def classify_rasters(raster_paths, predictor, output_path, windowed=False, n_workers=None, feature_cube=None,
+                     aoi_path=None):
+    """Klassifiziert einen Bandstapel mit dem gefalteten Modell und speichert das Ergebnis.
+
+    feature_cube: Ordner eines Merkmalswürfels (siehe modules.feature_cube), der statt der
+    Einzelbänder gelesen wird.
+    aoi_path: Analysefläche; klassifiziert wird nur innerhalb (Wert != 0), außerhalb NoData.
+        Blöcke ohne Analysefläche werden übersprungen.
+    """
     # ---------- 4. Rasterklassifikation ----------
+    if feature_cube is not None:
+        _classify_cube(feature_cube, predictor, output_path, n_workers, aoi_path)
+        print(f"\n✅ Klassifikation abgeschlossen. Ergebnis gespeichert unter: {output_path}")
+        return output_path
+
+    rasters = [rasterio.open(r) for r in raster_paths]
     meta = rasters[0].meta.copy()
     meta.update(dtype='uint8', count=1, nodata=0)
     nodata_values = [r.nodata for r in rasters]
 
-    height, width = rasters[0].shape
-    output = np.zeros((height, width), dtype=np.uint8)
-    raster_data = [r.read(1) for r in rasters]
+    if windowed:
+        _classify_windowed(raster_paths, predictor, meta, output_path, n_workers, aoi_path)
+    else:
+        height, width = rasters[0].shape
+        output = np.zeros((height, width), dtype=np.uint8)
+        raster_data = [r.read(1) for r in rasters]
+        aoi = None
+        if aoi_path is not None:
+            with open_aligned(aoi_path, rasters[0]) as aoi_raster:
+                aoi = aoi_raster.read(1) != 0
 
-    for row in tqdm(range(height), desc="Klassifiziere Rasterzeilen"):
-        row_data = [band[row, :] for band in raster_data]
-        row_stack = np.stack(row_data, axis=1)
+        # Mehrere Zeilen pro Vorhersage zusammenfassen (ca. 1 Mio. Pixel)
+        batch_rows = max(1, 2 ** 20 // width)
+        for row in tqdm(range(0, height, batch_rows), desc="Klassifiziere Rasterzeilen"):
+            rows = slice(row, row + batch_rows)
+            if aoi is not None and not aoi[rows].any():
+                continue  # keine Analysefläche, bleibt NoData
+            batch_stack = np.stack([band[rows, :].ravel() for band in raster_data], axis=1)
 
-        mask = np.zeros(row_stack.shape[0], dtype=bool)
-        for i, nodata in enumerate(nodata_values):
-            band_row = row_stack[:, i]
-            mask |= (band_row == nodata) | np.isnan(band_row)
+            mask = _nodata_mask(batch_stack, nodata_values)
+            if aoi is not None:
+                mask |= ~aoi[rows].ravel()
+            batch = np.zeros(batch_stack.shape[0], dtype=np.uint8)
 
-        valid_data = row_stack[~mask]
+            if not mask.all():
+                batch[~mask] = predict_pixels(predictor, batch_stack[~mask])
+            output[rows, :] = batch.reshape(-1, width)  # NoData bleibt 0
 
-        if valid_data.shape[0] > 0:
-            valid_scaled = scaler.transform(valid_data)
-            pred = clf.predict(valid_scaled)
-            output[row, ~mask] = pred
-        output[row, mask] = 0  # NoData
+        # ---------- 5. GeoTIFF speichern ----------
+        with open_output(output_path, meta) as dst:
+            dst.write(output, 1)
 
-    # ---------- 5. GeoTIFF speichern ----------
-    with rasterio.open(output_path, 'w', **meta) as dst:
-        dst.write(output, 1)
+    for r in rasters:
+        r.close()
 
     print(f"\n✅ Klassifikation abgeschlossen. Ergebnis gespeichert unter: {output_path}")
     return output_path
+
+
+def run_maxent(ndvi_path, ndwi_path, nbr_path, dswi_path, sw1_path, training_points, class_attribute, output_path=None,
+               windowed=False, n_workers=None, cache_dir=None, model_path=None, feature_cube=None, aoi_path=None):
+    raster_paths = band_order(ndvi_path, ndwi_path, nbr_path, dswi_path, sw1_path)
+    model = train_maxent(raster_paths, training_points, class_attribute, cache_dir, n_workers, model_path)
+    return classify_rasters(raster_paths, model["predictor"], output_path, windowed, n_workers, feature_cube,
+                            aoi_path)
+
+
+def predict_maxent(model_path, ndvi_path, ndwi_path, nbr_path, dswi_path, sw1_path, output_path,
+                   windowed=False, n_workers=None, feature_cube=None, aoi_path=None):
+    """Klassifiziert einen neuen Bandstapel mit einem gespeicherten Modell, ohne neu zu trainieren."""
+    model = load_model(model_path)
+    print(f"Modell geladen: {model_path} (trainiert {model['created']}, Klassen {model['classes']})")
+    raster_paths = band_order(ndvi_path, ndwi_path, nbr_path, dswi_path, sw1_path)
+    return classify_rasters(raster_paths, model["predictor"], output_path, windowed, n_workers, feature_cube,
+                            aoi_path)
@@ -0,0 +1,170 @@
+import os
+import numpy as np
+import rasterio
+from tqdm import tqdm
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from modules.maxent_classification import (BAND_NAMES, band_order, train_maxent, load_current_model, predict_pixels,
+                                          _nodata_mask)
+from modules.data_processing import _filter_block
+from modules.postprocess import _disturbance_block, _change_block
+from modules.rules import (DISTURBANCE_LAYERS, DISTURBANCE_RULES, CHANGE_LAYERS, CHANGE_RULES, compile_rules,
+                           is_empty_where)
+from utils.grid import open_aligned
+from utils.sparsity import build_sparsity_index, data_windows
+from utils.windows import block_windows
+from utils.output import open_output
+from utils.parallel import imap_bounded, resolve_workers
+
+# Zustand der Worker-Prozesse
+_worker_state = {}
+
+
+def _init_fused_worker(reference_path, sources, params):
+    with rasterio.open(reference_path) as reference:
+        _worker_state["sources"] = {name: open_aligned(path, reference) for name, path in sources.items()}
+    _worker_state["params"] = params
+
+
+def _read(name, window):
+    return _worker_state["sources"][name].read(1, window=window)
+
+
+def _process_window(window):
+    """Führt alle Stufen für ein Fenster aus und gibt (window, {Produkt: Block}) zurück."""
+    sources = _worker_state["sources"]
+    params = _worker_state["params"]
+    blocks = {}
+
+    # Klassifikation: vorhandenes Ergebnis lesen oder aus den Bändern vorhersagen
+    ndvi = None
+    if "classification" in sources:
+        klass = _read("classification", window)
+    else:
+        names = params["band_names"]
+        bands = [_read(name, window) for name in names]
+        stack = np.stack([band.ravel() for band in bands], axis=1)
+        nodata_values = [sources[name].nodata for name in names]
+
+        mask = _nodata_mask(stack, nodata_values)
+        klass = np.zeros(stack.shape[0], dtype=np.uint8)
+        if not mask.all():
+            klass[~mask] = predict_pixels(params["predictor"], stack[~mask])
+        klass = klass.reshape(window.height, window.width)
+        ndvi = bands[names.index("ndvi")]
+    blocks["classification"] = klass
+
+    ana = _read("analyseflaeche", window)
+
+    # Filtern der Klassifikation mit NDVI Schwellenwert
+    if params["ndvi_threshold"] is not None:
+        if ndvi is None:
+            ndvi = _read("ndvi", window)
+        klass = _filter_block(ndvi, klass, ana, params["ndvi_threshold"])
+        blocks["classification_filtered"] = klass
+
+    # Berechnung Schadflächen
+    disturbance = _disturbance_block(_read("harmonic", window), ana, klass, params["disturbance_rules"])
+    blocks["disturbance"] = disturbance
+
+    # Berechnung der Differenz
+    if params["change_rules"] is not None:
+        spring = _read("spring", window) if "spring" in sources else None
+        blocks["change"] = _change_block(_read("summer", window), disturbance, spring, params["change_rules"])
+
+    return window, {name: block for name, block in blocks.items() if name in params["outputs"]}
+
+
+def run_fused_pipeline(reference_path, force_paths, harmonic_path, analyseflaeche_path, modus, disturbance_path,
+                       classification_path=None, training_points=None, class_attribute=None, ndvi_threshold=None,
+                       spring_path=None, difference_path=None, intermediate_folder=None, block_size=None,
+                       n_workers=None, cache_dir=None, model_path=None, skip_empty=True):
+    """Klassifikation, NDVI-Filter, Schadflächen und Differenz blockweise in einem Durchlauf.
+
+    Alle Eingaben werden beim Lesen auf das Gitter von reference_path (Ergebnis des letzten
+    Sommers) gebracht, Zwischenergebnisse bleiben im Speicher. Geschrieben werden nur
+    disturbance_path und optional difference_path. Mit intermediate_folder werden zusätzlich
+    die Klassifikation und die gefilterte Klassifikation zur Kontrolle gespeichert.
+
+    force_paths: dict mit den Pfaden ndvi, ndwi, nbr, dswi, swir1.
+    classification_path: vorhandene Klassifikation, sonst wird mit den Trainingspunkten trainiert
+        bzw. das Modell aus model_path verwendet, falls die Datei existiert.
+    ndvi_threshold: None, wenn die Klassifikation nicht gefiltert werden soll.
+    difference_path: None, wenn keine Differenz berechnet werden soll.
+    cache_dir: Ablage für die extrahierten Trainingsdaten.
+    model_path: gespeichertes Modell; existiert es nicht oder passt es nicht zu den Trainingspunkten
+        (siehe load_current_model), wird neu trainiert und das Modell dort abgelegt. None = immer trainieren.
+    skip_empty: Blöcke ohne Analysefläche überspringen und je Block nur das engste Fenster um
+        die Analysefläche rechnen. Schadflächen und Differenz sind dort immer NoData, daher
+        gilt das nur, wenn keine Zwischenergebnisse gespeichert werden.
+    """
+    print("Starte verknüpfte Berechnung (Klassifikation bis Differenz)..")
+    n_workers = resolve_workers(n_workers)
+
+    sources = {"harmonic": harmonic_path, "analyseflaeche": analyseflaeche_path}
+    params = {
+        "ndvi_threshold": ndvi_threshold,
+        "disturbance_rules": compile_rules(DISTURBANCE_RULES, DISTURBANCE_LAYERS, modus),
+        "change_rules": None,
+    }
+
+    if classification_path is None:
+        band_paths = band_order(force_paths["ndvi"], force_paths["ndwi"], force_paths["nbr"],
+                                force_paths["dswi"], force_paths["swir1"])
+        params["band_names"] = BAND_NAMES
+        model = load_current_model(model_path, training_points, class_attribute)
+        if model is None:
+            model = train_maxent(band_paths, training_points, class_attribute, cache_dir, n_workers, model_path)
+        params["predictor"] = model["predictor"]
+        sources.update(dict(zip(params["band_names"], band_paths)))
+    else:
+        sources["classification"] = classification_path
+        if ndvi_threshold is not None:
+            sources["ndvi"] = force_paths["ndvi"]
+
+    if difference_path is not None:
+        params["change_rules"] = compile_rules(CHANGE_RULES, CHANGE_LAYERS, modus)
+        sources["summer"] = reference_path
+        if "spring" in params["change_rules"]["layers"]:
+            sources["spring"] = spring_path
+
+    # Ausgaben festlegen
+    outputs = {"disturbance": disturbance_path}
+    if difference_path is not None:
+        outputs["change"] = difference_path
+    if intermediate_folder is not None:
+        outputs["classification"] = os.path.join(intermediate_folder, "classification_coreg.tif")
+        if ndvi_threshold is not None:
+            outputs["classification_filtered"] = os.path.join(intermediate_folder,
+                                                              f"classification_filtered_{ndvi_threshold}.tif")
+
+    params["outputs"] = set(outputs)
+    skip_empty = (skip_empty and intermediate_folder is None
+                  and is_empty_where(params["disturbance_rules"], "ana", 0))
+
+    with rasterio.open(reference_path) as reference:
+        out_meta = reference.meta.copy()
+        windows = list(block_windows(reference, block_size))
+        if skip_empty:
+            windows = data_windows(build_sparsity_index(analyseflaeche_path, reference, windows))
+    out_meta.update({
+        "dtype": "uint8",
+        "nodata": 0,
+        "count": 1
+    })
+
+    with ExitStack() as stack:
+        dsts = {name: stack.enter_context(open_output(path, out_meta, block_size))
+                for name, path in outputs.items()}
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=n_workers,
+                                                           initializer=_init_fused_worker,
+                                                           initargs=(reference_path, sources, params)))
+
+        results = imap_bounded(executor, _process_window, windows, max_pending=2 * n_workers)
+        for window, blocks in tqdm(results, total=len(windows), desc="Verarbeite Rasterblöcke"):
+            for name, dst in dsts.items():
+                dst.write(blocks[name], 1, window=window)
+
+    for path in outputs.values():
+        print(f"Ergebnis gespeichert unter: {path}")
+    return disturbance_path
@@ -4,121 +4,110 @@ from rasterio.errors import RasterioIOError
 from datetime import datetime
 from pathlib import Path
 import rasterio
-
-def calculate_disturbance(harmonic_model_path, analyseflaeche_path, classification_path, modus, output_path):
+from contextlib import ExitStack
+from utils.windows import block_windows
+from utils.output import open_output
+from utils.sparsity import build_sparsity_index, data_windows
+from modules.rules import (DAMAGE_THRESHOLD, DISTURBANCE_LAYERS, DISTURBANCE_RULES, CHANGE_LAYERS,
+                           CHANGE_RULES, compile_rules, apply_rules, is_empty_where)
+
+def _disturbance_block(model, ana, klass, rules):
+    # Regeln per Lookup-Tabelle anwenden (siehe modules.rules.DISTURBANCE_RULES)
+    return apply_rules(rules, {"schaden": model < DAMAGE_THRESHOLD, "ana": ana, "klass": klass})
+
+
+def calculate_disturbance(harmonic_model_path, analyseflaeche_path, classification_path, modus, output_path,
+                          block_size=None, skip_empty=True):
+    """skip_empty: Blöcke ohne Analysefläche überspringen (NoData) und je Block nur das engste
+    Fenster um die Analysefläche rechnen. Das Ergebnis ist identisch, da die Regeln außerhalb
+    der Analysefläche immer 0 ergeben."""
     print("Berechne Schadflächen für das aktuelle Jahr..")
+    rules = compile_rules(DISTURBANCE_RULES, DISTURBANCE_LAYERS, modus)
+    skip_empty = skip_empty and is_empty_where(rules, "ana", 0)
+
     # --- 2. Raster öffnen und prüfen ---
     with rasterio.open(harmonic_model_path) as src_model, \
          rasterio.open(analyseflaeche_path) as src_ana, \
          rasterio.open(classification_path) as src_klass:
 
-        # Daten laden
-        model = src_model.read(1)
-        ana = src_ana.read(1)
-        klass = src_klass.read(1)
-
-        # Leeres Ausgaberaster
-        result = np.full(ana.shape, 0, dtype=np.uint8)
-
-        if modus == "fruehjahr":
-            # Regel 1: Freiflächen auf Nadelwald
-            mask1 = (model < -50) & (ana == 1) & (klass == 2)
-            result[mask1] = 2
-
-            # Regel 2: Stehend abgestorben auf Nadelwald
-            mask2 = (model < -50) & (ana == 1) & (klass == 3)
-            result[mask2] = 3
-
-            # Regel 3: Immergrüner Nadelwald vital
-            mask3 = (ana == 1) & ~mask1 & ~mask2
-            result[mask3] = 1
-
-            # Regel 4: Sonstiger Wald (Laubwald & Lärche)
-            mask4 = ((ana == 2) | (ana == 3)) & ~mask1 & ~mask2
-            result[mask4] = 4
-
-        if modus == "sommer":
-            # Regel 1: Freiflächen auf gesamter Analysefläche
-            mask1 = (model < -50) & (ana > 0) & (klass == 2)
-            result[mask1] = 2
-
-            # Regel 2: Stehend abgestorben auf gesamter Analysefläche
-            mask2 = (model < -50) & (ana > 0) & (klass == 3)
-            result[mask2] = 3
-
-            # Regel 3: Immergrüner Nadelwald vital
-            mask3 = (ana == 1) & ~mask1 & ~mask2
-            result[mask3] = 1
-
-            # Regel 4: Sonstiger Wald (Laubwald & Lärche)
-            mask4 = ((ana == 2) | (ana == 3)) & ~mask1 & ~mask2
-            result[mask4] = 4
-
-        # --- 3. Ergebnis speichern ---
         out_meta = src_model.meta.copy()
         out_meta.update({
             "dtype": "uint8",
             "nodata": 0
         })
 
-        # save raster
-        with rasterio.open(output_path, "w", **out_meta) as dst:
-            dst.write(result, 1)
+        if block_size or skip_empty:
+            windows = block_windows(src_model, block_size)
+            if skip_empty:
+                windows = data_windows(build_sparsity_index(analyseflaeche_path, src_model, windows))
+
+            # Blockweise lesen, Regeln anwenden und schreiben (nicht geschriebene Blöcke bleiben NoData)
+            with open_output(output_path, out_meta, block_size) as dst:
+                for window in windows:
+                    result = _disturbance_block(src_model.read(1, window=window), src_ana.read(1, window=window),
+                                                src_klass.read(1, window=window), rules)
+                    dst.write(result, 1, window=window)
+        else:
+            # Daten laden
+            result = _disturbance_block(src_model.read(1), src_ana.read(1), src_klass.read(1), rules)
+
+            # --- 3. Ergebnis speichern ---
+            with open_output(output_path, out_meta) as dst:
+                dst.write(result, 1)
 
     print("Klassifizierungs-Raster erfolgreich gespeichert:", output_path)
     return output_path
 
-def calculate_disturbance_change(result_last_year_summer_path, result_current_year_spring, result_current_year_path, modus, output_path):
-    print("Berechne Veränderung der Schadflächen..")
-    # --- Raster öffnen ---
-
-    with rasterio.open(result_last_year_summer_path) as summer_raster, \
-         rasterio.open(result_current_year_path) as current_raster:
-
-        summer = summer_raster.read(1)
-        current = current_raster.read(1)
-
-        # Ergebnisraster initiieren
-        result = current.copy()
-        nodata = 0
+def _change_block(summer, current, spring, rules):
+    nodata = 0
 
-        if modus == "fruehjahr":
+    # Regeln per Lookup-Tabelle anwenden (siehe modules.rules.CHANGE_RULES), 0 = aktuelles Ergebnis behalten
+    update = apply_rules(rules, {"summer": summer, "spring": spring})
 
-            # NoData überall durchreichen (vor dem Überschreiben markieren)
-            mask_nodata = (current == nodata) | (summer == nodata)
+    # NoData des aktuellen Ergebnisses durchreichen
+    result = np.where((update != 0) & (current != nodata), update, current)
 
-            # im vergangenen Frühjahr erfasste Freiflächen und stehend abgestorben (nur auf Nadelwald)
-            result[((summer == 2) | (summer == 3) | (summer == 4)) & ~mask_nodata] = 4
+    # optional: sicherstellen, dass dtype passt
+    return result.astype("uint8")
 
-        if modus == "sommer":
-            with rasterio.open(result_current_year_spring) as spring_raster:
 
-                spring = spring_raster.read(1)
-
-                # NoData überall durchreichen (vor dem Überschreiben markieren)
-                mask_nodata = (current == nodata) | (spring == nodata) | (summer == nodata)
-
-                # im vergangenen Frühjahr erfasste Freiflächen und stehend abgestorben (nur auf Nadelwald)
-                result[((spring == 2) | (spring == 3)) & ~mask_nodata] = 4
+def calculate_disturbance_change(result_last_year_summer_path, result_current_year_spring, result_current_year_path, modus, output_path,
+                                 block_size=None):
+    print("Berechne Veränderung der Schadflächen..")
+    rules = compile_rules(CHANGE_RULES, CHANGE_LAYERS, modus)
+    # --- Raster öffnen ---
 
-                # im vergangenen Sommer erfasste Freiflächen und stehend abgestorben (auf Nadelwald & sonstigen Laubwald)
-                result[((summer == 2) | (summer == 3)) & ~mask_nodata] = 4
+    with rasterio.open(result_last_year_summer_path) as summer_raster, \
+         rasterio.open(result_current_year_path) as current_raster, \
+         ExitStack() as stack:
 
-        # optional: sicherstellen, dass dtype passt
-        result = result.astype("uint8")
+        # Frühjahrsergebnis wird nur benötigt, wenn die Regeln des Modus es verwenden
+        spring_raster = None
+        if "spring" in rules["layers"]:
+            spring_raster = stack.enter_context(rasterio.open(result_current_year_spring))
 
-        # --- Ergebnis speichern ---
         out_meta = current_raster.meta.copy()
         out_meta.update({
             "dtype": "uint8",
             "nodata": 0,
-            "count": 1,
-            "compress": "lzw"
+            "count": 1
         })
 
-        # save raster
-        with rasterio.open(output_path, "w", **out_meta) as dst:
-            dst.write(result, 1)
+        if block_size:
+            # Blockweise lesen, Regeln anwenden und schreiben
+            with open_output(output_path, out_meta, block_size) as dst:
+                for window in block_windows(current_raster, block_size):
+                    spring = spring_raster.read(1, window=window) if spring_raster is not None else None
+                    result = _change_block(summer_raster.read(1, window=window),
+                                           current_raster.read(1, window=window), spring, rules)
+                    dst.write(result, 1, window=window)
+        else:
+            spring = spring_raster.read(1) if spring_raster is not None else None
+            result = _change_block(summer_raster.read(1), current_raster.read(1), spring, rules)
+
+            # save raster
+            with open_output(output_path, out_meta) as dst:
+                dst.write(result, 1)
 
     print(f"Ergebnis gespeichert unter: {output_path}")
     return output_path
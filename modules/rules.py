@@ -0,0 +1,136 @@
+import numpy as np
+
+# Schwellenwert des harmonischen Modells, unterhalb dessen ein Pixel als geschädigt gilt
+DAMAGE_THRESHOLD = -50
+
+# Gesamte Analysefläche (alle Codes außer NoData)
+ANALYSEFLAECHE = range(1, 256)
+
+# Eingangsebenen der Schadflächenberechnung mit Anzahl möglicher Codes
+DISTURBANCE_LAYERS = {"schaden": 2, "ana": 256, "klass": 256}
+
+# Regeln je Modus. Es gilt die erste zutreffende Regel, fehlende Ebenen bedeuten "beliebig".
+# Analysefläche: 1=Nadelwald, 2=Sonstiger Wald, 3=Lärche
+# Klassifikation: 1=Nadelwald, 2=Freifläche, 3=stehend abgestorben, 4=sonstiger Wald
+DISTURBANCE_RULES = {
+    "fruehjahr": [
+        # Regel 1: Freiflächen auf Nadelwald
+        {"value": 2, "schaden": (1,), "ana": (1,), "klass": (2,)},
+        # Regel 2: Stehend abgestorben auf Nadelwald
+        {"value": 3, "schaden": (1,), "ana": (1,), "klass": (3,)},
+        # Regel 3: Immergrüner Nadelwald vital
+        {"value": 1, "ana": (1,)},
+        # Regel 4: Sonstiger Wald (Laubwald & Lärche)
+        {"value": 4, "ana": (2, 3)},
+    ],
+    "sommer": [
+        # Regel 1: Freiflächen auf gesamter Analysefläche
+        {"value": 2, "schaden": (1,), "ana": ANALYSEFLAECHE, "klass": (2,)},
+        # Regel 2: Stehend abgestorben auf gesamter Analysefläche
+        {"value": 3, "schaden": (1,), "ana": ANALYSEFLAECHE, "klass": (3,)},
+        # Regel 3: Immergrüner Nadelwald vital
+        {"value": 1, "ana": (1,)},
+        # Regel 4: Sonstiger Wald (Laubwald & Lärche)
+        {"value": 4, "ana": (2, 3)},
+    ],
+}
+
+# Klassen der Ergebnisraster (für Statistik und Legende)
+DISTURBANCE_CLASSES = {
+    1: "Nadelwald vital",
+    2: "Freifläche",
+    3: "stehend abgestorben",
+    4: "sonstiger Wald",
+}
+
+# Eingangsebenen der Differenzberechnung. Der Regelwert ersetzt das aktuelle Ergebnis,
+# 0 bedeutet "aktuelles Ergebnis übernehmen".
+CHANGE_LAYERS = {"summer": 256, "spring": 256}
+
+CHANGE_RULES = {
+    "fruehjahr": [
+        # im vergangenen Frühjahr erfasste Freiflächen und stehend abgestorben (nur auf Nadelwald)
+        {"value": 4, "summer": (2, 3, 4)},
+    ],
+    "sommer": [
+        # im vergangenen Frühjahr erfasste Freiflächen und stehend abgestorben (nur auf Nadelwald)
+        {"value": 4, "spring": (2, 3), "summer": ANALYSEFLAECHE},
+        # im vergangenen Sommer erfasste Freiflächen und stehend abgestorben (auf Nadelwald & sonstigen Laubwald)
+        {"value": 4, "summer": (2, 3), "spring": ANALYSEFLAECHE},
+    ],
+}
+
+
+# In der Differenz markiert 4 zusätzlich bereits im Vorjahr bzw. Frühjahr erfasste Schadflächen
+CHANGE_CLASSES = {**DISTURBANCE_CLASSES, 4: "sonstiger Wald / bereits erfasst"}
+
+
+def compile_rules(rule_table, layers, modus):
+    """Übersetzt die Regeln eines Modus in eine Lookup-Tabelle.
+
+    Die Tabelle hat eine Achse pro verwendeter Eingangsebene und enthält für jede
+    Kombination von Codes den Ergebniswert der ersten zutreffenden Regel (sonst 0).
+    Jede Achse hat einen zusätzlichen letzten Eintrag für ungültige Codes (negativ,
+    zu groß, nicht ganzzahlig, NaN). Wie bei den früheren Maskenketten trifft darauf nur
+    eine Regel zu, die die Ebene nicht einschränkt.
+    """
+    if modus not in rule_table:
+        raise ValueError(f"Unbekannter modus '{modus}'. Erlaubt: {', '.join(rule_table)}")
+    rules = rule_table[modus]
+
+    # Nur Ebenen, die in mindestens einer Regel vorkommen, werden benötigt
+    names = tuple(name for name in layers if any(name in rule for rule in rules))
+    shape = tuple(layers[name] + 1 for name in names)
+
+    lut = np.zeros(shape, dtype=np.uint8)
+    assigned = np.zeros(shape, dtype=bool)
+
+    for rule in rules:
+        codes = [list(rule[name]) if name in rule else list(range(layers[name] + 1)) for name in names]
+        selection = np.ix_(*codes)
+        lut[selection] = np.where(assigned[selection], lut[selection], rule["value"])
+        assigned[selection] = True
+
+    return {"layers": names, "lut": lut}
+
+
+def _layer_index(codes, size):
+    """Codes einer Ebene als Index in die Lookup-Tabelle, ungültige Codes auf den Zusatzeintrag size."""
+    if codes.dtype == np.bool_ or (codes.dtype == np.uint8 and size >= 256):
+        return codes
+    if np.issubdtype(codes.dtype, np.integer):
+        valid = (codes >= 0) & (codes < size)
+    else:
+        # z.B. co-registrierte Float-Raster: nur ganzzahlige Werte im Bereich sind gültige Codes
+        with np.errstate(invalid="ignore"):
+            valid = (codes >= 0) & (codes < size) & (codes == np.floor(codes))
+    return np.where(valid, codes, size).astype(np.intp)
+
+
+def apply_rules(compiled, arrays):
+    """Wendet eine kompilierte Regeltabelle pixelweise an (ein Lookup pro Pixel).
+
+    Codes außerhalb der Ebene (z.B. NoData -9999) ergeben wie ohne passende Regel 0.
+    """
+    lut = compiled["lut"]
+    index = None
+
+    for name, slots in zip(compiled["layers"], lut.shape):
+        codes = _layer_index(arrays[name], slots - 1)
+        if index is None:
+            index = codes.astype(np.intp)
+        else:
+            index *= slots
+            index += codes
+
+    return lut.ravel()[index]
+
+
+def is_empty_where(compiled, layer, code=0):
+    """True, wenn die Regeln für alle Pixel mit layer == code den Wert 0 (NoData) ergeben.
+
+    Dann dürfen z.B. Blöcke ohne Analysefläche übersprungen und als NoData belassen werden.
+    """
+    if layer not in compiled["layers"]:
+        return not compiled["lut"].any()
+    return not np.take(compiled["lut"], code, axis=compiled["layers"].index(layer)).any()
@@ -0,0 +1,124 @@
+import csv
+import json
+from contextlib import ExitStack
+import numpy as np
+import rasterio
+from rasterio import features
+from rasterio.windows import bounds as window_bounds, transform as window_transform
+from utils.grid import open_aligned
+from utils.windows import block_windows
+
+# Vektorformate, die als Zonen rasterisiert werden
+_VECTOR_EXTENSIONS = (".shp", ".gpkg", ".fgb", ".geojson")
+
+# Klassencodes der Ergebnisse sind uint8
+_N_CLASSES = 256
+
+
+def _vector_zones(zone_path, zone_field, crs):
+    """Zonenpolygone mit ganzzahligen Codes (1..n) und Namen je Code."""
+    import geopandas as gpd  # nur für Vektorzonen benötigt
+
+    gdf = gpd.read_file(zone_path).to_crs(crs)
+    if zone_field is None:
+        names = [str(i + 1) for i in range(len(gdf))]
+    else:
+        names = [str(value) for value in gdf[zone_field]]
+    # gleiche Namen (z.B. mehrteilige Forstämter) bekommen denselben Code
+    unique = list(dict.fromkeys(names))
+    codes = np.array([unique.index(name) + 1 for name in names])
+    return gdf, codes, {i + 1: name for i, name in enumerate(unique)}
+
+
+def _rasterize_window(gdf, codes, window, src):
+    """Zonencodes der Polygone im Fenster (0 = keine Zone)."""
+    from shapely.geometry import box  # nur für Vektorzonen benötigt
+
+    candidates = gdf.sindex.query(box(*window_bounds(window, src.transform)))
+    if len(candidates) == 0:
+        return np.zeros((window.height, window.width), dtype=np.int64)
+    shapes = zip(gdf.geometry.values[candidates], codes[candidates])
+    return features.rasterize(shapes, out_shape=(window.height, window.width),
+                              transform=window_transform(window, src.transform), fill=0, dtype="int32")
+
+
+def area_statistics(raster_path, zone_path=None, zone_field=None, output_path=None, class_names=None,
+                    block_size=None):
+    """Fläche je Zone und Klasse eines Klassenrasters in Hektar.
+
+    Das Raster wird fensterweise gelesen, je Fenster werden die Pixel über den kombinierten
+    Code zone * 256 + klasse mit np.unique gezählt (auch bei großen Zonen-IDs nur so viele
+    Zähler wie vorkommende Codes). Es wird weder vektorisiert noch das ganze Raster im
+    Speicher gehalten.
+
+    zone_path: Zonenraster (z.B. Analysefläche, wird auf das Gitter gebracht) oder Vektordatei
+        (z.B. Forstämter, wird fensterweise rasterisiert). None = eine Zone für das ganze Raster.
+    zone_field: Attribut mit dem Zonennamen bei Vektorzonen, None = fortlaufende Nummer.
+    output_path: .csv oder .json, None = nur zurückgeben.
+    class_names: dict Klassencode -> Name für die Ausgabe.
+
+    NoData (0) im Klassenraster und Pixel ohne Zone werden nicht gezählt. Gibt eine Liste von
+    dicts (zone, zone_name, class, class_name, pixels, hectares) zurück.
+    """
+    print(f"Berechne Flächenstatistik: {raster_path}")
+    class_names = class_names or {}
+    counts = {}
+
+    with ExitStack() as stack:
+        src = stack.enter_context(rasterio.open(raster_path))
+        if src.crs is not None and src.crs.is_geographic:
+            raise ValueError("Flächenstatistik benötigt ein projiziertes Koordinatensystem.")
+        if src.dtypes[0] != "uint8":
+            raise ValueError(f"Klassenraster muss uint8 sein, nicht {src.dtypes[0]}.")
+        pixel_ha = abs(src.transform.a * src.transform.e) / 10000
+        nodata = src.nodata if src.nodata is not None else 0
+
+        zones = None
+        zone_names = {}
+        if zone_path is not None and zone_path.lower().endswith(_VECTOR_EXTENSIONS):
+            gdf, codes, zone_names = _vector_zones(zone_path, zone_field, src.crs)
+        elif zone_path is not None:
+            zones = stack.enter_context(open_aligned(zone_path, src))
+
+        for window in block_windows(src, block_size):
+            klass = src.read(1, window=window)
+            if zone_path is None:
+                zone = np.ones(klass.shape, dtype=np.int64)
+            elif zones is not None:
+                zone = zones.read(1, window=window).astype(np.int64)
+                if zones.nodata is not None:
+                    zone[zone == zones.nodata] = 0
+            else:
+                zone = _rasterize_window(gdf, codes, window, src).astype(np.int64)
+
+            valid = (klass != nodata) & (zone > 0)
+            if not valid.any():
+                continue
+            code, n = np.unique(zone[valid] * _N_CLASSES + klass[valid], return_counts=True)
+            for c, pixels in zip(code.tolist(), n.tolist()):
+                counts[c] = counts.get(c, 0) + pixels
+
+    rows = []
+    for code in sorted(counts):
+        zone, klass = divmod(code, _N_CLASSES)
+        rows.append({
+            "zone": zone,
+            "zone_name": zone_names.get(zone, str(zone)),
+            "class": klass,
+            "class_name": class_names.get(klass, str(klass)),
+            "pixels": counts[code],
+            "hectares": round(counts[code] * pixel_ha, 4),
+        })
+
+    if output_path is not None:
+        if output_path.lower().endswith(".json"):
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump({"raster": raster_path, "zones": zone_path, "pixel_ha": pixel_ha, "areas": rows},
+                          f, indent=2, ensure_ascii=False)
+        else:
+            with open(output_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=["zone", "zone_name", "class", "class_name", "pixels", "hectares"])
+                writer.writeheader()
+                writer.writerows(rows)
+        print(f"Flächenstatistik gespeichert unter: {output_path}")
+    return rows
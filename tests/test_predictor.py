@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from modules.maxent_classification import _make_classifier, _nodata_mask, compile_predictor, predict_pixels
+
+NODATA = -9999
+
+
+def _training_data(n_classes, rng):
+    """Fünf Bänder mit unterschiedlichen Skalen, Klassen um verschiedene Zentren verteilt."""
+    centers = rng.normal(0, 2, size=(n_classes, 5))
+    y = rng.integers(0, n_classes, size=600)
+    X = centers[y] + rng.normal(0, 1, size=(600, 5))
+    X = X * np.array([0.1, 1.0, 10.0, 100.0, 1000.0]) + np.array([0.5, -3.0, 20.0, 0.0, 3000.0])
+    return X.astype(np.float32), y + 1
+
+
+def _fit(X, y):
+    scaler = StandardScaler().fit(X)
+    clf = _make_classifier().fit(scaler.transform(X), y)
+    return scaler, clf
+
+
+@pytest.mark.parametrize("n_classes", [2, 4])
+def test_folded_predictor_matches_sklearn(n_classes):
+    rng = np.random.default_rng(n_classes)
+    X, y = _training_data(n_classes, rng)
+    scaler, clf = _fit(X, y)
+    predictor = compile_predictor(scaler, clf)
+
+    # binär: eine Koeffizientenzeile, sonst eine je Klasse
+    assert predictor["weights"].shape[1] == (1 if n_classes == 2 else n_classes)
+
+    X_new = _training_data(n_classes, rng)[0]
+    np.testing.assert_array_equal(predict_pixels(predictor, X_new), clf.predict(scaler.transform(X_new)))
+
+
+@pytest.mark.parametrize("n_classes", [2, 4])
+def test_nodata_rows_are_left_out(n_classes):
+    rng = np.random.default_rng(10 + n_classes)
+    X, y = _training_data(n_classes, rng)
+    scaler, clf = _fit(X, y)
+    predictor = compile_predictor(scaler, clf)
+
+    X_new = _training_data(n_classes, rng)[0]
+    X_new[::7, 2] = NODATA
+    X_new[::11, 0] = np.nan
+
+    # wie in der Klassifikation: NoData-Pixel bleiben 0, alle anderen werden vorhergesagt
+    mask = _nodata_mask(X_new, [NODATA] * X_new.shape[1])
+    output = np.zeros(len(X_new), dtype=np.uint8)
+    output[~mask] = predict_pixels(predictor, X_new[~mask])
+
+    assert mask.sum() > 0
+    assert np.all(output[mask] == 0)
+    np.testing.assert_array_equal(output[~mask], clf.predict(scaler.transform(X_new[~mask])))
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from modules.rules import (DAMAGE_THRESHOLD, DISTURBANCE_LAYERS, DISTURBANCE_RULES, apply_rules, compile_rules)
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.int32, np.float32])
+def test_invalid_codes_match_no_rule(dtype):
+    rules = compile_rules(DISTURBANCE_RULES, DISTURBANCE_LAYERS, "fruehjahr")
+    model = np.array([-100, -100, -100, -100, 0, 0], dtype=np.float32)
+    ana = np.array([1, 1, -9999, 300, 1, 2], dtype=dtype)
+    klass = np.array([2, -9999, 2, 2, 1000, 3], dtype=dtype)
+
+    result = apply_rules(rules, {"schaden": model < DAMAGE_THRESHOLD, "ana": ana, "klass": klass})
+
+    # ungültige Klassifikation: Regeln 1/2 greifen nicht, Nadelwald bleibt vital (1)
+    np.testing.assert_array_equal(result, [2, 1, 0, 0, 1, 4])
+
+
+def test_non_integer_codes_match_no_rule():
+    rules = compile_rules(DISTURBANCE_RULES, DISTURBANCE_LAYERS, "fruehjahr")
+    ana = np.array([1.0, 1.5, np.nan, 2.0], dtype=np.float32)
+    klass = np.zeros(4, dtype=np.float32)
+
+    result = apply_rules(rules, {"schaden": np.zeros(4, dtype=bool), "ana": ana, "klass": klass})
+    np.testing.assert_array_equal(result, [1, 0, 0, 4])
@@ -0,0 +1,85 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from modules.data_processing import vectorize_raster, vectorize_raster_tiled
+
+MIN_AREA = 500
+
+
+def _fragmented_raster(tmp_path, with_nodata):
+    """256 x 256 Klassenraster (10 m) aus 8er-Blöcken mit verstreuten Einzelpixeln.
+
+    Mit NoData entstehen kleine Flächen, die nur über Ecken oder gar nicht an andere grenzen
+    und daher zu nicht zusammenhängenden Gruppen gemergt werden.
+    """
+    rng = np.random.default_rng(0)
+    band = rng.integers(1, 5, size=(32, 32)).repeat(8, axis=0).repeat(8, axis=1).astype("uint8")
+    noise = rng.random(band.shape)
+    band[noise < 0.15] = rng.integers(1, 5, size=(noise < 0.15).sum())
+    if with_nodata:
+        band[noise > 0.8] = 0
+    path = str(tmp_path / "klassen.tif")
+    with rasterio.open(path, "w", driver="GTiff", width=256, height=256, count=1, dtype="uint8",
+                       crs="EPSG:25832", transform=from_origin(0, 2560, 10, 10), nodata=0) as dst:
+        dst.write(band, 1)
+    return path
+
+
+@pytest.fixture
+def fragmented_raster(tmp_path):
+    return _fragmented_raster(tmp_path, with_nodata=True)
+
+
+@pytest.fixture
+def raster_without_nodata(tmp_path):
+    # Sieve ohne NoData lässt keine kleinen Flächen übrig, die vectorize_raster danach noch vektoriell mergt
+    return _fragmented_raster(tmp_path, with_nodata=False)
+
+
+def _vectorize(raster_path, tmp_path, sieve, tile_size):
+    untiled = gpd.read_file(vectorize_raster(raster_path, MIN_AREA, str(tmp_path / "untiled.gpkg"), sieve=sieve))
+    tiled = gpd.read_file(vectorize_raster_tiled(raster_path, MIN_AREA, str(tmp_path / "tiled.gpkg"),
+                                                 tile_size=tile_size, n_workers=2, sieve=sieve))
+    return untiled, tiled
+
+
+def _class_difference(a, b):
+    return a.dissolve("class").symmetric_difference(b.dissolve("class")).area.sum()
+
+
+@pytest.mark.parametrize("tile_size", [64, 100, 256])
+def test_tiled_merge_matches_untiled(fragmented_raster, tmp_path, tile_size):
+    untiled, tiled = _vectorize(fragmented_raster, tmp_path, sieve=False, tile_size=tile_size)
+
+    # gemergte Gruppen bleiben ein Feature, keine Fläche unter der Mindestfläche
+    assert len(tiled) == len(untiled)
+    assert (tiled.area < MIN_AREA).sum() == 0
+    assert sorted(zip(tiled["class"], tiled.area.round(3))) == sorted(zip(untiled["class"], untiled.area.round(3)))
+    assert _class_difference(tiled, untiled) == pytest.approx(0, abs=1e-6)
+
+
+def test_tiled_sieve_matches_untiled_in_one_tile(raster_without_nodata, tmp_path):
+    untiled, tiled = _vectorize(raster_without_nodata, tmp_path, sieve=True, tile_size=256)
+
+    assert len(tiled) == len(untiled)
+    assert _class_difference(tiled, untiled) == pytest.approx(0, abs=1e-6)
+
+
+def test_tiled_sieve_keeps_coverage_and_min_area(raster_without_nodata, tmp_path):
+    untiled, tiled = _vectorize(raster_without_nodata, tmp_path, sieve=True, tile_size=64)
+
+    # an Kachelgrenzen darf der Sieve kleine Flächen anderen Nachbarn zuordnen (siehe Docstring)
+    assert tiled.area.sum() == pytest.approx(untiled.area.sum())
+    assert (tiled.area < MIN_AREA).sum() == 0
+
+
+def test_tiled_sieve_keeps_small_areas_without_neighbour(fragmented_raster, tmp_path):
+    untiled, tiled = _vectorize(fragmented_raster, tmp_path, sieve=True, tile_size=64)
+
+    # nur an NoData grenzende Flächen bleiben klein, sie werden gestreamt nicht vektoriell gemergt
+    assert tiled.area.sum() == pytest.approx(untiled.area.sum())
+    assert (untiled.area < MIN_AREA).sum() == 0
+    assert tiled[tiled.area < MIN_AREA].area.sum() < 0.05 * tiled.area.sum()
@@ -0,0 +1,325 @@
+import copy
+import csv
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import rasterio
+import yaml
+
+from utils.cache import cache_key, evict_lru, file_fingerprint
+from utils.parser import fix_backslashes_in_paths
+
+# Grobe Schätzung des Speicherbedarfs eines Laufs: Grundbedarf plus Bytes je Pixel des größten Rasters
+_BASE_MEMORY_GB = 1.0
+_BYTES_PER_PIXEL = 40  # ganze Raster im Speicher (Bänder float32, Klassifikation, Zwischenergebnisse)
+_BYTES_PER_PIXEL_BLOCKWISE = 12  # blockweise Stufen, Vektorisierung liest das Differenzraster weiterhin ganz
+
+_MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def _deep_merge(base, override):
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _load_yaml(path):
+    with open(path, "r") as stream:
+        return fix_backslashes_in_paths(yaml.safe_load(stream))
+
+
+def load_config_runs(config_paths):
+    """Ein Lauf je Konfigurationsdatei, benannt nach dem Dateinamen."""
+    runs = []
+    for path in config_paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if any(run["name"] == name for run in runs):
+            name = f"{name}_{len(runs)}"
+        runs.append({"name": name, "config": _load_yaml(path)})
+    return runs
+
+
+def expand_regions(region_file):
+    """Läufe aus einer Regionsliste: Basiskonfiguration x Regionen x Modi.
+
+    Die Regionsliste enthält base (Pfad zur Basiskonfiguration), optional modes (Liste der
+    Modi für alle Regionen) und regions mit name, optional overrides (beliebige Parameter)
+    und optional modes (dict Modus -> Parameter nur für diesen Modus). Ohne output_folder
+    in den Overrides wird <output_folder der Basis>/<Region>/<Modus> verwendet.
+    """
+    spec = _load_yaml(region_file)
+    base_path = spec["base"]
+    if not os.path.isabs(base_path):
+        base_path = os.path.join(os.path.dirname(os.path.abspath(region_file)), base_path)
+    base = _load_yaml(base_path)
+
+    runs = []
+    for region in spec["regions"]:
+        region_config = _deep_merge(base, region.get("overrides"))
+        modes = region.get("modes") or {modus: {} for modus in spec.get("modes", [base["modus"]])}
+        for modus, overrides in modes.items():
+            config = _deep_merge(region_config, overrides)
+            config["modus"] = modus
+            if "output_folder" not in (region.get("overrides") or {}) and "output_folder" not in (overrides or {}):
+                config["output_folder"] = os.path.join(base["output_folder"], region["name"], modus)
+            runs.append({"name": f"{region['name']}_{modus}", "config": config})
+    return runs
+
+
+def run_outputs(config):
+    """Pfade der Ergebnisse eines Laufs (wie in main.py benannt)."""
+    year = str(datetime.now().year)
+    folder = config["output_folder"]
+    return [os.path.join(folder, f"disturbance_monitoring_{year}_{config['modus']}.tif"),
+            os.path.join(folder, f"disturbance_change_{year}_{config['modus']}.tif")]
+
+
+def _string_values(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _string_values(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _string_values(v)
+
+
+def estimate_memory_gb(config):
+    """Geschätzter Spitzen-Speicherbedarf eines Laufs in GB (memory_gb in der Konfiguration hat Vorrang)."""
+    if config.get("memory_gb"):
+        return float(config["memory_gb"])
+
+    pixels = 0
+    for path in _string_values(config):
+        if path.lower().endswith((".tif", ".tiff")) and os.path.isfile(path):
+            with rasterio.open(path) as src:
+                pixels = max(pixels, src.width * src.height)
+
+    blockwise = config.get("block_size") or config.get("fused", False)
+    bytes_per_pixel = _BYTES_PER_PIXEL_BLOCKWISE if blockwise else _BYTES_PER_PIXEL
+    return _BASE_MEMORY_GB + pixels * bytes_per_pixel / 1024 ** 3
+
+
+def _bands_key(config):
+    """Kurzer Schlüssel aus den Fingerabdrücken der FORCE-Bänder eines Laufs."""
+    from modules.feature_cube import BAND_NAMES
+    paths = [config["force"][name] for name in BAND_NAMES]
+    return cache_key([file_fingerprint(path) if os.path.isfile(path) else path for path in paths])[:16]
+
+
+def prepare_runs(runs, batch_folder, max_parallel):
+    """Setzt gemeinsame Caches, Worker-Anzahl und Abhängigkeiten und schreibt die Konfigurationen.
+
+    Ein Lauf hängt von einem anderen ab, wenn er dessen Ergebnis als Eingabe verwendet
+    (z.B. Sommer-Lauf liest die Differenz des Frühjahrs-Laufs derselben Region).
+    Ein Merkmalswürfel, den mehrere Läufe gemeinsam hätten (z.B. aus der Basiskonfiguration
+    geerbt), liegt unter <batch_folder>/feature_cube/<Schlüssel der FORCE-Bänder>: Läufe mit
+    gleichen Bändern teilen einen Würfel, andere Bänder erhalten einen eigenen. Gebaut werden
+    die gemeinsamen Würfel vor dem Start der Läufe (build_feature_cubes).
+    Ein gemeinsames MaxEnt-Modell erhält je Lauf einen eigenen Pfad unter <batch_folder>/<Lauf>,
+    damit parallele Läufe es nicht gegenseitig überschreiben. Ein vorhandenes Modell wird
+    dorthin kopiert und weiterhin genutzt, solange es zu den Trainingspunkten des Laufs passt.
+    """
+    config_folder = os.path.join(batch_folder, "configs")
+    os.makedirs(config_folder, exist_ok=True)
+    workers = max(1, (os.cpu_count() or 1) // max_parallel)
+
+    producers = {}
+    for run in runs:
+        for path in run_outputs(run["config"]):
+            producers[path] = run["name"]
+
+    # Von mehreren Läufen geschriebene Pfade
+    cubes = [run["config"].get("feature_cube") for run in runs]
+    models = [(run["config"].get("maxent") or {}).get("model") for run in runs]
+
+    for run in runs:
+        config = run["config"]
+        run_folder = os.path.join(batch_folder, run["name"])
+        run["shared_cube"] = bool(config.get("feature_cube")) and cubes.count(config["feature_cube"]) > 1
+        if run["shared_cube"]:
+            config["feature_cube"] = os.path.join(batch_folder, "feature_cube", _bands_key(config))
+        model = (config.get("maxent") or {}).get("model")
+        if model and models.count(model) > 1:
+            config["maxent"]["model"] = os.path.join(run_folder, "maxent_model.joblib")
+            if os.path.isfile(model) and not os.path.exists(config["maxent"]["model"]):
+                os.makedirs(run_folder, exist_ok=True)
+                shutil.copyfile(model, config["maxent"]["model"])
+        # Co-Registrierungen und Trainingsdaten über alle Läufe teilen
+        config["coreg_cache"] = config.get("coreg_cache") or {}
+        if not config["coreg_cache"].get("folder"):
+            config["coreg_cache"]["folder"] = os.path.join(batch_folder, "coreg_cache")
+        # Während des Batches nichts löschen, ein Lauf könnte sonst Einträge entfernen, die ein
+        # anderer gerade verwendet. Begrenzt wird einmal nach allen Läufen (evict_caches).
+        run["coreg_cache_max_size_gb"] = config["coreg_cache"].get("max_size_gb", 20)
+        config["coreg_cache"]["max_size_gb"] = None
+        if not config.get("sample_cache"):
+            config["sample_cache"] = os.path.join(batch_folder, "sample_cache")
+        if not config.get("n_workers"):
+            config["n_workers"] = workers
+
+        run["depends_on"] = sorted({producers[path] for path in _string_values(config)
+                                    if path in producers and producers[path] != run["name"]})
+        run["memory_gb"] = estimate_memory_gb(config)
+        run["config_path"] = os.path.join(config_folder, f"{run['name']}.yaml")
+        with open(run["config_path"], "w") as f:
+            yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    return runs
+
+
+def build_feature_cubes(runs):
+    """Baut jeden gemeinsamen Merkmalswürfel einmal, bevor die Läufe starten.
+
+    Die Läufe finden ihren Würfel damit aktuell vor und lesen ihn nur, es schreiben nie zwei
+    Läufe gleichzeitig in denselben Würfel. Eigene Würfel einzelner Läufe baut der Lauf selbst.
+    """
+    from modules.feature_cube import BAND_NAMES, build_feature_cube
+    built = set()
+    for run in runs:
+        config = run["config"]
+        # wie in main.py: Würfel nur für getrennte Stufen, die die Bänder lesen
+        needed = not config.get("fused", False) and \
+            (config["maxent"]["classification"] is None or config["postprocess_classification"])
+        if run.get("shared_cube") and needed and config["feature_cube"] not in built:
+            build_feature_cube({name: config["force"][name] for name in BAND_NAMES}, config["feature_cube"])
+            built.add(config["feature_cube"])
+
+
+def _start(run, batch_folder):
+    os.makedirs(run["config"]["output_folder"], exist_ok=True)
+    run["log_path"] = os.path.join(batch_folder, "logs", f"{run['name']}.log")
+    os.makedirs(os.path.dirname(run["log_path"]), exist_ok=True)
+    run["log"] = open(run["log_path"], "w")
+    run["started"] = time.time()
+    run["process"] = subprocess.Popen([sys.executable, _MAIN, "--config", run["config_path"], "--headless"],
+                                      stdout=run["log"], stderr=subprocess.STDOUT,
+                                      cwd=os.path.dirname(_MAIN))
+    print(f"Starte {run['name']} (geschätzt {run['memory_gb']:.1f} GB)..")
+
+
+def _finish(run):
+    run["log"].close()
+    run["wall_s"] = round(time.time() - run["started"], 1)
+    run["returncode"] = run["process"].returncode
+    run["status"] = "ok" if run["returncode"] == 0 else "failed"
+
+    # Laufprotokoll des Laufs (siehe utils.profiling) für den Gesamtbericht lesen
+    manifests = [path for path in glob.glob(os.path.join(run["config"]["output_folder"], "run_manifest_*.json"))
+                 if os.path.getmtime(path) >= run["started"]]
+    run["stages"] = []
+    if manifests:
+        with open(max(manifests, key=os.path.getmtime)) as f:
+            run["stages"] = json.load(f)["stages"]
+    print(f"{run['name']} beendet: {run['status']} nach {run['wall_s']} s")
+
+
+def run_batch(runs, batch_folder, max_parallel=2, memory_gb=None):
+    """Führt die Läufe als eigene Prozesse (main.py --headless) parallel aus.
+
+    Gestartet wird in Reihenfolge der Liste, sobald alle Abhängigkeiten erfolgreich beendet
+    sind, weniger als max_parallel Läufe aktiv sind und der geschätzte Speicherbedarf aller
+    aktiven Läufe memory_gb nicht überschreitet. Ein einzelner Lauf startet immer, auch wenn
+    er allein das Budget überschreitet. Läufe, deren Abhängigkeit fehlgeschlagen ist, werden
+    übersprungen.
+    """
+    pending = list(runs)
+    running = []
+    status = {}
+
+    while pending or running:
+        for run in list(pending):
+            if len(running) >= max_parallel:
+                break
+            if any(status.get(dep) in ("failed", "skipped") for dep in run["depends_on"]):
+                run["status"] = status[run["name"]] = "skipped"
+                pending.remove(run)
+                print(f"{run['name']} übersprungen, Abhängigkeit fehlgeschlagen.")
+                continue
+            if not all(status.get(dep) == "ok" for dep in run["depends_on"]):
+                continue
+            used = sum(r["memory_gb"] for r in running)
+            if running and memory_gb is not None and used + run["memory_gb"] > memory_gb:
+                # Reihenfolge einhalten, damit große Läufe nicht dauerhaft verdrängt werden
+                break
+            _start(run, batch_folder)
+            pending.remove(run)
+            running.append(run)
+
+        for run in list(running):
+            if run["process"].poll() is not None:
+                _finish(run)
+                status[run["name"]] = run["status"]
+                running.remove(run)
+
+        if running:
+            time.sleep(1)
+        elif pending and not any(all(status.get(dep) == "ok" for dep in run["depends_on"]) for run in pending):
+            # verbleibende Läufe hängen von Läufen außerhalb des Batches oder zyklisch voneinander ab
+            for run in pending:
+                run["status"] = status[run["name"]] = "skipped"
+                print(f"{run['name']} übersprungen, Abhängigkeit nicht erfüllbar.")
+            pending = []
+    return runs
+
+
+def evict_caches(runs):
+    """Begrenzt die Co-Registrierungs-Caches der Läufe nach dem Batch auf ihre maximale Größe.
+
+    Teilen sich Läufe einen Cache, gilt die kleinste ihrer Grenzen.
+    """
+    limits = {}
+    for run in runs:
+        folder = run["config"]["coreg_cache"]["folder"]
+        limit = run.get("coreg_cache_max_size_gb")
+        if limit is not None and os.path.isdir(folder):
+            limits[folder] = min(limit, limits.get(folder, limit))
+    for folder, limit in limits.items():
+        evict_lru(folder, limit * 1024 ** 3)
+
+
+def write_report(runs, batch_folder, wall_s):
+    """Gesamtbericht als JSON (mit allen Stufen) und CSV (eine Zeile je Lauf)."""
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "wall_s": round(wall_s, 1),
+        "sum_run_wall_s": round(sum(run.get("wall_s", 0) for run in runs), 1),
+        "runs": [{
+            "name": run["name"],
+            "status": run.get("status"),
+            "returncode": run.get("returncode"),
+            "wall_s": run.get("wall_s"),
+            "memory_gb_estimate": round(run["memory_gb"], 2),
+            "depends_on": run["depends_on"],
+            "config": run["config_path"],
+            "log": run.get("log_path"),
+            "outputs": [path for path in run_outputs(run["config"]) if os.path.exists(path)],
+            "stages": run.get("stages", []),
+        } for run in runs],
+    }
+    json_path = os.path.join(batch_folder, "batch_report.json")
+    with open(json_path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    csv_path = os.path.join(batch_folder, "batch_report.csv")
+    stage_names = sorted({s["name"] for run in runs for s in run.get("stages", [])})
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "status", "wall_s", "memory_gb_estimate"] + [f"{s}_s" for s in stage_names])
+        for run in runs:
+            times = {s["name"]: s.get("wall_s", "") for s in run.get("stages", [])}
+            writer.writerow([run["name"], run.get("status"), run.get("wall_s"), round(run["memory_gb"], 2)]
+                            + [times.get(s, "") for s in stage_names])
+
+    print(f"Gesamtbericht gespeichert unter: {json_path}")
+    return json_path
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+
+# Anzahl Bytes am Dateianfang und -ende, die in den Fingerabdruck eingehen
+_SAMPLE_BYTES = 1024 * 1024
+
+
+def file_fingerprint(path):
+    """Fingerabdruck einer Datei aus Größe, Änderungszeit sowie Anfang und Ende des Inhalts.
+
+    Liest höchstens 2 MiB, erkennt aber ersetzte oder neu geschriebene Dateien.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(_SAMPLE_BYTES))
+        if stat.st_size > 2 * _SAMPLE_BYTES:
+            f.seek(-_SAMPLE_BYTES, os.SEEK_END)
+            digest.update(f.read(_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def cache_key(*parts):
+    """Stabiler Schlüssel aus beliebigen JSON-serialisierbaren Bestandteilen."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def touch(path):
+    """Markiert einen Cache-Eintrag als zuletzt verwendet."""
+    os.utime(path, None)
+
+
+def evict_lru(cache_dir, max_bytes, keep=None):
+    """Löscht die am längsten nicht verwendeten Dateien, bis der Cache höchstens max_bytes groß ist.
+
+    keep: Pfad eines Eintrags, der nie gelöscht wird (z.B. der gerade geschriebene).
+    Temporäre Dateien (".tmp." im Namen) anderer, gleichzeitig laufender Prozesse bleiben erhalten.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if os.path.isfile(path) and path != keep and ".tmp." not in name:
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    if keep is not None:
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
@@ -0,0 +1,43 @@
+import os
+import rasterio
+from geo_utils.raster_utils import co_registration
+from utils.cache import file_fingerprint, cache_key, touch, evict_lru
+from utils.grid import same_grid
+
+
+def cached_co_registration(reference_path, source_path, resampling, cache_dir, max_size_gb=20):
+    """co_registration mit inhaltsadressiertem Cache.
+
+    Der Schlüssel besteht aus dem Fingerabdruck der Quelldatei, dem Zielgitter (CRS,
+    Transformation, Größe) und der Resampling-Methode. Liegt die Quelle bereits auf dem
+    Zielgitter, wird sie ohne Warping direkt zurückgegeben. Der Cache wird nach dem
+    LRU-Prinzip auf max_size_gb begrenzt. max_size_gb=None löscht nichts, z.B. während
+    parallele Batch-Läufe den Cache teilen und Einträge verwenden, die ein anderer Lauf
+    sonst löschen könnte.
+
+    Gibt den Pfad zum co-registrierten Raster zurück.
+    """
+    with rasterio.open(reference_path) as reference, rasterio.open(source_path) as source:
+        if same_grid(source, reference):
+            print(f"Co-Registrierung übersprungen, gleiches Gitter: {source_path}")
+            return source_path
+        grid = (reference.crs.to_wkt(), tuple(reference.transform), reference.width, reference.height)
+
+    key = cache_key(file_fingerprint(source_path), grid, resampling)
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_path = os.path.join(cache_dir, f"{key}.tif")
+
+    if os.path.exists(cached_path):
+        print(f"Co-Registrierung aus Cache: {source_path}")
+        touch(cached_path)
+        return cached_path
+
+    # Erst in temporäre Datei schreiben, damit abgebrochene Läufe keinen halben Eintrag hinterlassen
+    # (je Prozess eigene Datei, der Cache kann von parallelen Läufen geteilt werden)
+    tmp_path = os.path.join(cache_dir, f"{key}.{os.getpid()}.tmp.tif")
+    co_registration(reference_path, source_path, resampling, tmp_path)
+    os.replace(tmp_path, cached_path)
+
+    if max_size_gb is not None:
+        evict_lru(cache_dir, max_size_gb * 1024 ** 3, keep=cached_path)
+    return cached_path
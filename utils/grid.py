@@ -0,0 +1,34 @@
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+
+
+def same_grid(a, b):
+    """True, wenn zwei geöffnete Raster dasselbe Pixelgitter haben (CRS, Transformation, Größe)."""
+    return (a.crs == b.crs
+            and a.transform.almost_equals(b.transform)
+            and a.width == b.width
+            and a.height == b.height)
+
+
+class _AlignedVRT(WarpedVRT):
+    """WarpedVRT, die beim Schließen auch das zugrunde liegende Raster schließt."""
+
+    def close(self):
+        super().close()
+        self.src_dataset.close()
+
+
+def open_aligned(path, reference, resampling=Resampling.nearest):
+    """Öffnet ein Raster auf dem Pixelgitter von reference.
+
+    Liegt das Raster bereits auf demselben Gitter, wird es direkt geöffnet, sonst über eine
+    WarpedVRT, die blockweise beim Lesen resampled. Es entsteht keine Zwischendatei.
+    Schließen (auch per with) schließt in beiden Fällen alle geöffneten Dateien.
+    """
+    src = rasterio.open(path)
+    if same_grid(src, reference):
+        return src
+
+    return _AlignedVRT(src, crs=reference.crs, transform=reference.transform,
+                     width=reference.width, height=reference.height, resampling=resampling)
@@ -1,4 +1,8 @@
 def hold_point(config, message="Ergebnisse prüfen. Weiter mit Enter, Abbruch mit 'n': "):
+    # Ohne Eingabeaufforderung (headless): nur Checkpoint melden, Stempel der Stufen sind bereits geschrieben
+    if config.get("headless", False):
+        print(f"Checkpoint: {message}")
+        return
     if config.get("hold", False):
         user_input = input(message)
         if user_input.lower() == "n":
@@ -0,0 +1,128 @@
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.shutil import copy as copy_raster
+
+# Einstellungen für alle Ausgaberaster, per configure_output (Parameter output in der config) änderbar
+OUTPUT_OPTIONS = {
+    "compress": "zstd",  # zstd, deflate, lzw oder none
+    "level": None,  # Kompressionsstufe, None = Standard des Treibers
+    "predictor": True,  # horizontale Differenz (Ganzzahlen) bzw. Gleitkomma-Prädiktor
+    "blocksize": 512,  # Kachelgröße in Pixeln
+    "overviews": True,  # interne Übersichten (Pyramiden)
+    "cog": True,  # Cloud Optimized GeoTIFF, sonst gekacheltes GeoTIFF mit Übersichten am Dateiende
+    "num_threads": "ALL_CPUS",  # Threads für die Kompression
+}
+
+# Kompressionsstufe der Zwischendatei vor der COG-Konvertierung (schnell statt klein)
+_TMP_LEVEL = {"zstd": 1, "deflate": 1}
+
+
+def configure_output(options=None):
+    """Übernimmt Einstellungen für Ausgaberaster, z.B. {"compress": "deflate", "level": 6}."""
+    for key, value in (options or {}).items():
+        if key not in OUTPUT_OPTIONS:
+            raise ValueError(f"Unbekannte Ausgabe-Option: {key}. Erlaubt sind {', '.join(OUTPUT_OPTIONS)}.")
+        OUTPUT_OPTIONS[key] = value
+
+
+def _predictor(dtype):
+    """GTiff-Prädiktor: 2 für Ganzzahlen, 3 für Gleitkommazahlen, None ohne Prädiktor."""
+    if not OUTPUT_OPTIONS["predictor"] or OUTPUT_OPTIONS["compress"] not in ("zstd", "deflate", "lzw"):
+        return None
+    return 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+
+
+def output_profile(meta, block_size=None, fast=False):
+    """GTiff-Profil für ein gekacheltes, komprimiertes Ausgaberaster.
+
+    Ist block_size ein Vielfaches von 16, entsprechen die Kacheln den geschriebenen
+    Fenstern, sonst wird die eingestellte Kachelgröße verwendet. fast wählt die schnellste
+    Kompressionsstufe (für Zwischendateien).
+    """
+    profile = {key: value for key, value in meta.items()
+               if key not in ("compress", "predictor", "tiled", "blockxsize", "blockysize", "interleave")}
+    tile = block_size if block_size and block_size % 16 == 0 else OUTPUT_OPTIONS["blocksize"]
+    compress = OUTPUT_OPTIONS["compress"]
+    profile.update({
+        "driver": "GTiff",
+        "tiled": True,
+        "blockxsize": tile,
+        "blockysize": tile,
+        "num_threads": OUTPUT_OPTIONS["num_threads"],
+        "bigtiff": "IF_SAFER",
+    })
+    if fast:
+        # nie geschriebene Kacheln (z.B. übersprungene leere Blöcke) nicht anlegen, sie lesen sich als NoData
+        profile["sparse_ok"] = True
+    if compress and compress != "none":
+        profile["compress"] = compress
+        predictor = _predictor(profile["dtype"])
+        if predictor:
+            profile["predictor"] = predictor
+        level = _TMP_LEVEL.get(compress) if fast else OUTPUT_OPTIONS["level"]
+        if level is not None and compress == "zstd":
+            profile["zstd_level"] = level
+        elif level is not None and compress == "deflate":
+            profile["zlevel"] = level
+    return profile
+
+
+def _overview_factors(width, height, blocksize):
+    """Faktoren wie beim COG-Treiber: halbieren, bis die Übersicht nicht mehr größer als eine Kachel ist."""
+    factors = []
+    factor = 1
+    while min(width, height) / factor > blocksize:
+        factor *= 2
+        factors.append(factor)
+    return factors
+
+
+def _cog_options(dtype, resampling):
+    compress = OUTPUT_OPTIONS["compress"]
+    options = {
+        "compress": compress if compress else "none",
+        "blocksize": OUTPUT_OPTIONS["blocksize"],
+        "overviews": "AUTO" if OUTPUT_OPTIONS["overviews"] else "NONE",
+        "overview_resampling": resampling.upper(),
+        "num_threads": OUTPUT_OPTIONS["num_threads"],
+        "bigtiff": "IF_SAFER",
+    }
+    predictor = _predictor(dtype)
+    if predictor:
+        options["predictor"] = "STANDARD" if predictor == 2 else "FLOATING_POINT"
+    if OUTPUT_OPTIONS["level"] is not None and compress in ("zstd", "deflate"):
+        options["level"] = OUTPUT_OPTIONS["level"]
+    return options
+
+
+@contextmanager
+def open_output(path, meta, block_size=None, resampling="nearest"):
+    """Öffnet ein Ausgaberaster zum Schreiben, ganz oder fensterweise wie mit rasterio.open.
+
+    Mit cog wird zunächst eine schnell komprimierte Zwischendatei geschrieben und beim
+    Schließen mit dem COG-Treiber (Übersichten, Kompression und Kacheln nach
+    OUTPUT_OPTIONS, mehrere Threads) nach path kopiert. Ohne cog wird direkt ein
+    gekacheltes GeoTIFF geschrieben und die Übersichten am Ende ergänzt.
+    resampling: Methode für die Übersichten, nearest für Klassenraster.
+    """
+    if not OUTPUT_OPTIONS["cog"]:
+        with rasterio.open(path, "w", **output_profile(meta, block_size)) as dst:
+            yield dst
+            factors = _overview_factors(dst.width, dst.height, OUTPUT_OPTIONS["blocksize"])
+            if OUTPUT_OPTIONS["overviews"] and factors:
+                dst.build_overviews(factors, Resampling[resampling])
+                dst.update_tags(ns="rio_overview", resampling=resampling)
+        return
+
+    tmp_path = os.path.splitext(path)[0] + ".tmp.tif"
+    try:
+        with rasterio.open(tmp_path, "w", **output_profile(meta, block_size, fast=True)) as dst:
+            yield dst
+        copy_raster(tmp_path, path, driver="COG", **_cog_options(meta["dtype"], resampling))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,30 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+def resolve_workers(n_workers):
+    """Anzahl der Worker-Prozesse: None oder 0 bedeutet alle verfügbaren Kerne."""
+    if not n_workers:
+        return os.cpu_count() or 1
+    return int(n_workers)
+
+
+def imap_bounded(executor, fn, iterable, max_pending):
+    """Wie executor.map, aber mit höchstens max_pending offenen Aufgaben.
+
+    Ergebnisse werden in der Reihenfolge ihrer Fertigstellung geliefert. Dadurch sammeln
+    sich im Hauptprozess nie mehr als max_pending Ergebnisse an, auch wenn das Schreiben
+    langsamer ist als die Berechnung.
+    """
+    pending = set()
+    for item in iterable:
+        pending.add(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
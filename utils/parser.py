@@ -15,16 +15,51 @@ def fix_backslashes_in_paths(config):
                     value[i] = value[i].replace("\\", "/")
     return config
 
-def load_config():
-    parser = argparse.ArgumentParser(description="Run pipeline with config.yaml")
+# Unterbefehle: Name -> Beschreibung. Ohne Unterbefehl wird run-all ausgeführt.
+COMMANDS = {
+    "run-all": "Run all stages enabled in the config (default)",
+    "classify": "MaxEnt classification of the FORCE bands",
+    "filter": "Filter the classification with the NDVI threshold",
+    "disturbance": "Calculate the disturbance areas",
+    "change": "Calculate the change against last year / spring",
+    "vectorize": "Vectorize the change raster",
+    "statistics": "Area per zone and class of the disturbance and change rasters",
+}
+
+
+def _add_run_arguments(parser, default):
+    # Im Unterbefehl SUPPRESS, damit vor dem Unterbefehl angegebene Werte nicht überschrieben werden
     parser.add_argument(
-        "--config", type=str, required=True, help="Path to the config.yaml file"
+        "--config", type=str, default=default, help="Path to the config.yaml file"
     )
+    parser.add_argument(
+        "--headless", action="store_true", default=default or False,
+        help="Run without prompts, hold points only log a checkpoint"
+    )
+    parser.add_argument(
+        "--stop-after", type=str, default=default, help="Stop after the named stage (checkpoint)"
+    )
+
+
+def load_config():
+    parser = argparse.ArgumentParser(description="Run pipeline with config.yaml")
+    _add_run_arguments(parser, None)
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    for name, description in COMMANDS.items():
+        _add_run_arguments(subparsers.add_parser(name, help=description, description=description),
+                           argparse.SUPPRESS)
     args = parser.parse_args()
+    if args.config is None:
+        parser.error("the following arguments are required: --config")
 
     with open(args.config, "r") as stream:
         config = yaml.safe_load(stream)
 
     config = fix_backslashes_in_paths(config)
+    config["command"] = args.command or "run-all"
+    if args.headless:
+        config["headless"] = True
+    if args.stop_after:
+        config["stop_after"] = args.stop_after
 
-    return config
\ No newline at end of file
+    return config
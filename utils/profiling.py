@@ -0,0 +1,259 @@
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import rasterio
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Dateiendungen, für die Pixel bzw. Polygone gezählt werden
+_RASTER_EXTENSIONS = (".tif", ".tiff", ".vrt")
+_VECTOR_EXTENSIONS = (".shp", ".gpkg", ".fgb", ".geojson")
+
+
+def _read_proc(name, pid="self"):
+    """Inhalt von /proc/<pid>/<name> als dict (nur Linux), sonst None."""
+    try:
+        with open(f"/proc/{pid}/{name}") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    return {key.strip(): value.strip() for key, value in (line.split(":", 1) for line in lines if ":" in line)}
+
+
+def _reset_peak_rss():
+    """Setzt den Spitzenwert des Speichers zurück (Linux >= 4.0), damit er je Stufe gilt."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(stage_local):
+    """Spitzen-Speicherbedarf des Hauptprozesses in MB.
+
+    Nach _reset_peak_rss aus VmHWM (gilt nur für die Stufe), sonst ru_maxrss (Spitzenwert
+    seit Programmstart). Ohne beides (Windows) None.
+    """
+    if stage_local:
+        status = _read_proc("status")
+        if status and "VmHWM" in status:
+            return int(status["VmHWM"].split()[0]) / 1024
+    return _maxrss_mb(resource.RUSAGE_SELF) if resource is not None else None
+
+
+def _maxrss_mb(who):
+    """ru_maxrss von getrusage(who) in MB (RUSAGE_SELF oder RUSAGE_CHILDREN), ohne resource None."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(who).ru_maxrss
+    # Linux liefert kB, macOS Bytes
+    return usage / 1024 ** 2 if sys.platform == "darwin" else usage / 1024
+
+
+def _workers(pid=None):
+    """PIDs aller laufenden Nachkommen von pid (Standard: dieser Prozess), nur Linux, sonst None."""
+    try:
+        entries = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+    parents = {}
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Feld 4 ist die PPID, der Prozessname in Klammern kann Leerzeichen enthalten
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    workers = set()
+    level = {os.getpid() if pid is None else pid}
+    while level:
+        level = {pid for pid, parent in parents.items() if parent in level} - workers
+        workers |= level
+    return workers
+
+
+def _rss_mb(pid="self"):
+    """Aktueller Speicherbedarf (RSS) eines Prozesses in MB, 0 ohne /proc oder wenn er beendet ist."""
+    status = _read_proc("status", pid)
+    if status and "VmRSS" in status:
+        return int(status["VmRSS"].split()[0]) / 1024
+    return 0.0
+
+
+def _workers_rss_mb(pid=None):
+    """Aktueller Speicherbedarf (RSS) aller laufenden Worker von pid zusammen in MB, nur Linux."""
+    return sum(_rss_mb(worker) for worker in _workers(pid) or ())
+
+
+def _sample_rss(stop, peak, measure, interval):
+    """Misst bis stop gesetzt ist alle interval Sekunden measure() und merkt sich in peak[0] das Maximum."""
+    while not stop.is_set():
+        peak[0] = max(peak[0], measure())
+        stop.wait(interval)
+
+
+def _io_bytes():
+    """Gelesene und geschriebene Bytes (rchar/wchar) von Hauptprozess und Workern, nur Linux.
+
+    Der Kernel rechnet die Bytes beendeter Worker dem Hauptprozess zu, laufende Worker
+    werden einzeln addiert. Die Differenz zweier Messungen ist damit die I/O dazwischen.
+    """
+    io = _read_proc("io")
+    if io is None:
+        return None
+    read, written = int(io["rchar"]), int(io["wchar"])
+    for pid in _workers() or ():
+        worker_io = _read_proc("io", pid)
+        if worker_io:
+            read += int(worker_io["rchar"])
+            written += int(worker_io["wchar"])
+    return read, written
+
+
+def _describe(path):
+    """Größe und Pixel- bzw. Polygonanzahl einer Ein- oder Ausgabedatei."""
+    info = {"path": path, "bytes": os.path.getsize(path) if os.path.isfile(path) else None}
+    if info["bytes"] is None:
+        return info
+
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension in _RASTER_EXTENSIONS:
+            with rasterio.open(path) as src:
+                info["pixels"] = src.width * src.height
+        elif extension in _VECTOR_EXTENSIONS:
+            import fiona  # nur bei Vektordateien, hält den Start leichter Stufen schnell
+            with fiona.open(path) as src:
+                info["polygons"] = len(src)
+    except Exception as e:
+        info["error"] = str(e)
+    return info
+
+
+def start_run(config, manifest_folder, profiler=None):
+    """Legt einen Lauf an, dessen Stufen mit stage() erfasst werden.
+
+    profiler: None, "cprofile" oder "pyinstrument" (Sampling-Profiler, muss installiert sein).
+        Je Stufe wird ein Profil im Ordner des Manifests gespeichert.
+    """
+    if profiler not in (None, "cprofile", "pyinstrument"):
+        raise ValueError(f"Unbekannter Profiler: {profiler}. Erlaubt sind cprofile und pyinstrument.")
+
+    started = datetime.now()
+    os.makedirs(manifest_folder, exist_ok=True)
+    return {
+        "manifest_path": os.path.join(manifest_folder, f"run_manifest_{started:%Y%m%d_%H%M%S}.json"),
+        "profiler": profiler,
+        "started": started.isoformat(timespec="seconds"),
+        "wall": time.perf_counter(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "stages": [],
+    }
+
+
+@contextmanager
+def _profile(run, name):
+    """Führt den Block unter dem gewählten Profiler aus und speichert das Profil der Stufe."""
+    folder = os.path.dirname(run["manifest_path"])
+    if run["profiler"] == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(folder, f"profile_{name}.prof"))
+    elif run["profiler"] == "pyinstrument":
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(os.path.join(folder, f"profile_{name}.html"), "w") as f:
+                f.write(profiler.output_html())
+    else:
+        yield
+
+
+@contextmanager
+def stage(run, name, inputs=(), outputs=()):
+    """Erfasst Laufzeit, CPU-Zeit, Speicher und I/O einer Stufe im Lauf.
+
+    inputs/outputs: Pfade der gelesenen und geschriebenen Dateien. Für Raster wird die
+    Pixelanzahl, für Vektordaten die Polygonanzahl aufgezeichnet. Ausgaben, deren Pfad
+    erst die Stufe liefert, können an record["outputs"] angehängt werden.
+    CPU-Zeit und Speicher der Worker-Prozesse werden getrennt ausgewiesen: peak_rss_workers_mb
+    ist der höchste Speicherbedarf aller gleichzeitig laufenden Worker während der Stufe
+    (Stichproben alle 100 ms, nur Linux). bytes_read/bytes_written enthalten die I/O der Worker.
+    """
+    record = {"name": name, "status": "running", "inputs": list(inputs), "outputs": list(outputs)}
+    run["stages"].append(record)
+
+    stage_local = _reset_peak_rss()
+    io_start = _io_bytes()
+    # ru_maxrss der Kinder gilt seit Programmstart, daher den Speicher der Worker hier messen
+    workers_peak = [0.0]
+    stop = threading.Event()
+    sampler = None
+    if _workers() is not None:
+        sampler = threading.Thread(target=_sample_rss, args=(stop, workers_peak, _workers_rss_mb, 0.1),
+                                   daemon=True)
+        sampler.start()
+    times_start = os.times()
+    wall_start = time.perf_counter()
+    try:
+        with _profile(run, name):
+            yield record
+        record["status"] = "ok"
+    except BaseException as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if sampler is not None:
+            stop.set()
+            sampler.join()
+        times_end = os.times()
+        record["wall_s"] = round(time.perf_counter() - wall_start, 3)
+        record["cpu_s"] = round(max(0.0, times_end.user + times_end.system
+                                    - times_start.user - times_start.system), 3)
+        record["cpu_workers_s"] = round(max(0.0, times_end.children_user + times_end.children_system
+                                            - times_start.children_user - times_start.children_system), 3)
+        record["peak_rss_mb"] = _peak_rss_mb(stage_local)
+        record["peak_rss_workers_mb"] = round(workers_peak[0], 1) if sampler is not None else None
+        io_end = _io_bytes()
+        if io_start is not None and io_end is not None:
+            record["bytes_read"] = io_end[0] - io_start[0]
+            record["bytes_written"] = io_end[1] - io_start[1]
+        record["inputs"] = [_describe(path) for path in record["inputs"] if path]
+        record["outputs"] = [_describe(path) for path in record["outputs"] if path]
+
+
+def write_manifest(run):
+    """Speichert den Lauf mit allen Stufen als JSON und gibt den Pfad zurück."""
+    manifest = {key: value for key, value in run.items() if key not in ("wall", "manifest_path")}
+    manifest["finished"] = datetime.now().isoformat(timespec="seconds")
+    manifest["wall_s"] = round(time.perf_counter() - run["wall"], 3)
+
+    with open(run["manifest_path"], "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    print(f"Laufprotokoll gespeichert unter: {run['manifest_path']}")
+    return run["manifest_path"]
@@ -0,0 +1,45 @@
+import numpy as np
+from rasterio.windows import Window
+from utils.grid import open_aligned
+
+
+def _tight_window(mask, window):
+    """Kleinstes Fenster um alle True-Pixel von mask (in Koordinaten des Rasters), None wenn leer."""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return Window(window.col_off + int(cols[0]), window.row_off + int(rows[0]),
+                  int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1))
+
+
+def build_sparsity_index(aoi_path, reference, windows):
+    """Index der Analysefläche über die Verarbeitungsfenster.
+
+    Die Analysefläche wird einmal fensterweise auf dem Gitter von reference gelesen
+    (Werte != 0 gelten als Analysefläche). Zurückgegeben wird ein dict mit windows,
+    has_data (Bitmap: Fenster enthält Analysefläche) und tight (je Fenster das engste
+    Fenster um die Analysefläche oder None).
+    """
+    windows = list(windows)
+    src = open_aligned(aoi_path, reference)
+    try:
+        tight = [_tight_window(src.read(1, window=window) != 0, window) for window in windows]
+    finally:
+        src.close()
+
+    index = {
+        "windows": windows,
+        "has_data": np.array([t is not None for t in tight], dtype=bool),
+        "tight": tight,
+    }
+    total = sum(w.width * w.height for w in windows)
+    kept = sum(t.width * t.height for t in tight if t is not None)
+    print(f"Analysefläche in {index['has_data'].sum()} von {len(windows)} Blöcken, "
+          f"verarbeitet werden {kept / max(total, 1):.0%} der Pixel.")
+    return index
+
+
+def data_windows(index):
+    """Enge Fenster aller Blöcke mit Analysefläche, leere Blöcke entfallen."""
+    return [t for t in index["tight"] if t is not None]
@@ -0,0 +1,91 @@
+import json
+import os
+from utils.cache import cache_key, file_fingerprint
+from utils.helper import hold_point
+from utils.profiling import stage as record_stage
+
+# Version der Stempel-Dateien, bei Änderungen erhöhen
+STAMP_VERSION = 1
+
+
+def _fingerprint(path):
+    return file_fingerprint(path) if os.path.isfile(path) else None
+
+
+def _stamp_path(state_dir, name):
+    return os.path.join(state_dir, f"{name}.json")
+
+
+def stage_key(stage):
+    """Schlüssel aus Name, Parametern und Fingerabdrücken aller Eingaben einer Stufe."""
+    inputs = {path: _fingerprint(path) for path in stage["inputs"] if path}
+    return cache_key(STAMP_VERSION, stage["name"], stage.get("params", {}), inputs)
+
+
+def is_up_to_date(stage, state_dir, key):
+    """True, wenn die Stufe mit denselben Eingaben und Parametern gelaufen ist und ihre
+    Ausgaben seitdem unverändert sind."""
+    stamp_path = _stamp_path(state_dir, stage["name"])
+    if not os.path.exists(stamp_path):
+        return False
+    with open(stamp_path) as f:
+        stamp = json.load(f)
+    if stamp["key"] != key or set(stamp["outputs"]) != {path for path in stage["outputs"] if path}:
+        return False
+    return all(_fingerprint(path) == fingerprint for path, fingerprint in stamp["outputs"].items())
+
+
+def _write_stamp(stage, state_dir, key):
+    stamp = {
+        "key": key,
+        "params": stage.get("params", {}),
+        "outputs": {path: _fingerprint(path) for path in stage["outputs"] if path},
+    }
+    tmp_path = _stamp_path(state_dir, stage["name"]) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(stamp, f, indent=2, default=str)
+    os.replace(tmp_path, _stamp_path(state_dir, stage["name"]))
+
+
+def check_graph(stages):
+    """Prüft, dass jede Stufe nur Ausgaben vorheriger Stufen liest (topologische Reihenfolge)."""
+    producers = {path: s["name"] for s in stages for path in s["outputs"] if path}
+    done = set()
+    for s in stages:
+        for path in s["inputs"]:
+            if path in producers and producers[path] not in done and producers[path] != s["name"]:
+                raise ValueError(f"Stufe {s['name']} liest {path}, das erst von {producers[path]} erzeugt wird.")
+        done.add(s["name"])
+
+
+def run_stages(stages, state_dir, run, config, incremental=True):
+    """Führt die Stufen in Reihenfolge aus und überspringt aktuelle Stufen.
+
+    Jede Stufe ist ein dict mit name, run (Funktion ohne Argumente), inputs und outputs
+    (Pfade), params (dict der ergebnisrelevanten Parameter) und optional hold (Meldung
+    für den Haltepunkt nach der Stufe). Nach jeder ausgeführten Stufe wird ein Stempel mit
+    den Fingerabdrücken in state_dir geschrieben. Eine Stufe läuft erneut, wenn sich eine
+    Eingabe, ein Parameter oder eine Ausgabe geändert hat; da neu geschriebene Ausgaben
+    neue Fingerabdrücke haben, laufen damit auch alle nachfolgenden Stufen erneut.
+
+    Mit config["stop_after"] endet der Lauf nach der genannten Stufe (Checkpoint), ein
+    erneuter Aufruf setzt dort fort.
+    """
+    check_graph(stages)
+    os.makedirs(state_dir, exist_ok=True)
+
+    for s in stages:
+        key = stage_key(s)
+        if incremental and is_up_to_date(s, state_dir, key):
+            print(f"Stufe {s['name']} ist aktuell, wird übersprungen.")
+            run["stages"].append({"name": s["name"], "status": "skipped"})
+        else:
+            with record_stage(run, s["name"], s["inputs"], s["outputs"]):
+                s["run"]()
+            _write_stamp(s, state_dir, key)
+            if s.get("hold"):
+                hold_point(config, s["hold"])
+
+        if config.get("stop_after") == s["name"]:
+            print(f"Checkpoint nach Stufe {s['name']} erreicht. Erneuter Aufruf setzt hier fort.")
+            return
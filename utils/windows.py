@@ -0,0 +1,33 @@
+from rasterio.windows import Window
+
+
+def block_windows(src, block_size=None, min_pixels=2 ** 20):
+    """Fenster zur blockweisen Verarbeitung eines Rasters.
+
+    Ohne block_size werden die internen Blöcke des Rasters genutzt. Bei zeilenweise
+    gespeicherten Rastern (Strips) werden mehrere Strips zusammengefasst, bis ein Fenster
+    mindestens min_pixels Pixel enthält. Mit block_size entsteht ein regelmäßiges Gitter
+    aus Fenstern mit block_size x block_size Pixeln.
+    """
+    height, width = src.height, src.width
+
+    if block_size:
+        for row_off in range(0, height, block_size):
+            for col_off in range(0, width, block_size):
+                yield Window(col_off, row_off,
+                             min(block_size, width - col_off),
+                             min(block_size, height - row_off))
+        return
+
+    block_height, block_width = src.block_shapes[0]
+    if block_width < width:
+        # Gekachelte Raster: interne Kacheln direkt verwenden
+        for _, window in src.block_windows(1):
+            yield window
+        return
+
+    # Strips zu größeren Zeilenblöcken zusammenfassen
+    rows = max(block_height, (min_pixels // width) // block_height * block_height)
+    for row_off in range(0, height, rows):
+        yield Window(0, row_off, width, min(rows, height - row_off))
+